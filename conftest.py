@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def temp_cache(django_test_environment):
+    """pytest, как и manage.py test, не трогает кеш работающего сайта."""
+    from core.test_runner import temp_cache
+
+    with temp_cache():
+        yield
@@ -0,0 +1,363 @@
+"""Двухуровневый кеш: L1 в памяти процесса, L2 в общем файле SQLite.
+
+L1 - небольшой LRU, живущий в каждом WSGI-воркере; L2 - таблица SQLite,
+которую читают и пишут все воркеры хоста. Каждая запись в L2 попадает
+в журнал изменений; воркер не реже раза в SYNC_INTERVAL секунд читает
+новые записи журнала и выбрасывает изменённые ключи из своего L1, так
+что чужая инвалидация видна всем воркерам с ограниченной задержкой.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Метка в журнале изменений, означающая очистку всего кеша
+CLEAR_ALL = '*'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE TABLE IF NOT EXISTS cache_changes ('
+    ' seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,'
+    ' origin TEXT NOT NULL, changed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_changes_changed'
+    ' ON cache_changes (changed)',
+)
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.sync_interval = float(options.get('SYNC_INTERVAL', 1.0))
+        # Журнал хранится дольше, чем любой воркер может не синхронизироваться
+        self.changes_ttl = float(options.get('CHANGES_TTL', 300))
+        self._reset()
+
+    def _reset(self):
+        # Свои изменения процесс уже применил к L1, при синхронизации
+        # они пропускаются
+        self._pid = os.getpid()
+        self._origin = uuid.uuid4().hex
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._l1 = OrderedDict()
+        self._last_seq = None
+        self._last_sync = 0.0
+        self._stats = {
+            'l1': {'hits': 0, 'misses': 0},
+            'l2': {'hits': 0, 'misses': 0},
+        }
+
+    # L2
+
+    @property
+    def _db(self):
+        if self._pid != os.getpid():
+            # Процесс порождён fork: соединение SQLite и метка источника
+            # родителя здесь использоваться не должны
+            self._reset()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    def _write(self, callback):
+        """Выполняет запись в L2 в одной транзакции BEGIN IMMEDIATE."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = callback(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        if random.random() < 0.01:
+            self._prune(db)
+        return result
+
+    def _log_change(self, db, key):
+        db.execute(
+            'INSERT INTO cache_changes (key, origin, changed)'
+            ' VALUES (?, ?, ?)',
+            (key, self._origin, time.time()),
+        )
+
+    def _store(self, db, key, value, expires):
+        db.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires)'
+            ' VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires),
+        )
+        self._log_change(db, key)
+
+    def _prune(self, db):
+        now = time.time()
+        db.execute('DELETE FROM cache_entries WHERE expires < ?', (now,))
+        db.execute(
+            'DELETE FROM cache_changes WHERE changed < ?',
+            (now - self.changes_ttl,),
+        )
+
+    def _expires(self, timeout):
+        # Абсолютное время истечения; None - запись без срока
+        return self.get_backend_timeout(timeout)
+
+    # L1
+
+    def _missed_changes(self, db):
+        """Последний номер журнала, если процесс пропустил изменения.
+
+        Номера записей идут подряд (AUTOINCREMENT, записи сериализованы
+        BEGIN IMMEDIATE), пропуски появляются только после _prune.
+        Если пропусков нет, возвращает None.
+        """
+        last, first = db.execute(
+            'SELECT (SELECT seq FROM sqlite_sequence'
+            "        WHERE name = 'cache_changes'),"
+            ' (SELECT MIN(seq) FROM cache_changes)'
+        ).fetchone()
+        if (last or 0) <= self._last_seq:
+            return None
+        if first is None or first > self._last_seq + 1:
+            return last
+        return None
+
+    def _sync(self):
+        """Выбрасывает из L1 ключи, изменённые другими процессами."""
+        now = time.monotonic()
+        if now - self._last_sync < self.sync_interval:
+            return
+        db = self._db
+        with self._lock:
+            if self._last_seq is None:
+                row = db.execute('SELECT MAX(seq) FROM cache_changes')
+                self._last_seq = row.fetchone()[0] or 0
+                self._last_sync = now
+                return
+            last = self._missed_changes(db)
+            if last is not None:
+                # Часть изменений уже вычищена из журнала: какие ключи
+                # устарели, не узнать, поэтому L1 сбрасывается целиком
+                self._l1.clear()
+                self._last_seq = last
+                self._last_sync = now
+                return
+            changes = db.execute(
+                'SELECT seq, key, origin FROM cache_changes WHERE seq > ?'
+                ' ORDER BY seq', (self._last_seq,)
+            ).fetchall()
+            for seq, key, origin in changes:
+                if origin == self._origin:
+                    pass
+                elif key == CLEAR_ALL:
+                    self._l1.clear()
+                else:
+                    self._l1.pop(key, None)
+                self._last_seq = seq
+            self._last_sync = now
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry
+
+    def _l1_set(self, key, value, expires):
+        with self._lock:
+            self._l1[key] = (value, expires)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+
+    def _count(self, tier, outcome):
+        with self._lock:
+            self._stats[tier][outcome] += 1
+
+    # API кеша Django
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        return self._get_many_raw([key]).get(key, default)
+
+    def _get_many_raw(self, keys):
+        for key in keys:
+            self.validate_key(key)
+        self._sync()
+        found, missing = {}, []
+        for key in keys:
+            entry = self._l1_get(key)
+            if entry is None:
+                self._count('l1', 'misses')
+                missing.append(key)
+            else:
+                self._count('l1', 'hits')
+                found[key] = entry[0]
+        if missing:
+            now = time.time()
+            placeholders = ', '.join('?' * len(missing))
+            rows = self._db.execute(
+                'SELECT key, value, expires FROM cache_entries'
+                f' WHERE key IN ({placeholders})', missing,
+            ).fetchall()
+            for key, blob, expires in rows:
+                if expires is not None and expires <= now:
+                    continue
+                value = pickle.loads(blob)
+                found[key] = value
+                self._l1_set(key, value, expires)
+            hits = sum(1 for key in missing if key in found)
+            with self._lock:
+                self._stats['l2']['hits'] += hits
+                self._stats['l2']['misses'] += len(missing) - hits
+        return found
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        found = self._get_many_raw(list(made))
+        return {made[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expires(timeout)
+        self._write(lambda db: self._store(db, key, value, expires))
+        self._l1_set(key, value, expires)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        items = {
+            self.make_key(key, version=version): value
+            for key, value in data.items()
+        }
+        for key in items:
+            self.validate_key(key)
+
+        def store_all(db):
+            for key, value in items.items():
+                self._store(db, key, value, expires)
+        self._write(store_all)
+        for key, value in items.items():
+            self._l1_set(key, value, expires)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expires(timeout)
+
+        def add_if_missing(db):
+            row = db.execute(
+                'SELECT expires FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and (row[0] is None or row[0] > time.time()):
+                return False
+            self._store(db, key, value, expires)
+            return True
+        added = self._write(add_if_missing)
+        if added:
+            self._l1_set(key, value, expires)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def increment(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache_entries WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            self._store(db, key, value, row[1])
+            return value, row[1]
+        value, expires = self._write(increment)
+        self._l1_set(key, value, expires)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expires = self._expires(timeout)
+
+        def update_expiry(db):
+            updated = db.execute(
+                'UPDATE cache_entries SET expires = ? WHERE key = ?',
+                (expires, key),
+            ).rowcount
+            self._log_change(db, key)
+            return bool(updated)
+        self._l1_delete(key)
+        return self._write(update_expiry)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def remove(db):
+            db.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self._log_change(db, key)
+        self._write(remove)
+        self._l1_delete(key)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+
+        def remove_all(db):
+            for key in keys:
+                db.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                self._log_change(db, key)
+        self._write(remove_all)
+        for key in keys:
+            self._l1_delete(key)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        def remove_all(db):
+            db.execute('DELETE FROM cache_entries')
+            self._log_change(db, CLEAR_ALL)
+        self._write(remove_all)
+        with self._lock:
+            self._l1.clear()
+
+    def close(self, **kwargs):
+        # Соединение с L2 живёт всё время жизни потока воркера
+        pass
+
+    def get_stats(self):
+        """Попадания и промахи по уровням в текущем процессе."""
+        with self._lock:
+            stats = {tier: dict(counters)
+                     for tier, counters in self._stats.items()}
+            stats['l1']['entries'] = len(self._l1)
+        return stats
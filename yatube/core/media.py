@@ -0,0 +1,140 @@
+"""Отдача загруженных файлов из MEDIA_ROOT самим приложением.
+
+Сильный ETag - хеш содержимого, вычисленный один раз для пары
+(mtime, размер); условные запросы получают 304, Range - 206 с частью
+файла. Целый файл отдаётся через FileResponse, и сервер может
+передать его sendfile без копирования в память. Если задан
+MEDIA_ACCEL_REDIRECT, файл отдаёт прокси по заголовку X-Accel-Redirect.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=4096)
+def file_etag(path, mtime_ns, size):
+    """ETag файла; mtime и размер в ключе сбрасывают его при изменении."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(header, etag):
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in (tag.replace('W/', '', 1) for tag in tags)
+
+
+def parse_range(header, size):
+    """(начало, конец) единственного диапазона или None, если он не один.
+
+    Для диапазона за концом файла возвращает (size, size).
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return size, size
+    return start, end
+
+
+def read_range(file, start, length):
+    """Генератор части файла; без fileno, чтобы сервер не отдал весь файл."""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def set_cache_headers(response, etag, stat):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = (
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def find_media_file(path):
+    """Полный путь и stat файла внутри MEDIA_ROOT, иначе 404."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return full_path, stat
+
+
+def requested_range(request, etag, size):
+    # Устаревший If-Range означает запрос всего файла
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' not in request.META or if_range not in (None, etag):
+        return None
+    return parse_range(request.META['HTTP_RANGE'], size)
+
+
+@require_safe
+def serve_media(request, path):
+    full_path, stat = find_media_file(path)
+    etag = file_etag(full_path, stat.st_mtime_ns, stat.st_size)
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        return set_cache_headers(HttpResponseNotModified(), etag, stat)
+    content_type = mimetypes.guess_type(full_path)[0]
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_ACCEL_REDIRECT:
+        # Файл и диапазоны отдаёт прокси из internal-локации; nginx
+        # раскодирует URI, поэтому пробелы, '?' и '%' в имени экранируются
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT + quote(path.lstrip('/'))
+        )
+        return set_cache_headers(response, etag, stat)
+    byte_range = requested_range(request, etag, stat.st_size)
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+        return set_cache_headers(response, etag, stat)
+    start, end = byte_range
+    if start == stat.st_size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return set_cache_headers(response, etag, stat)
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        read_range(open(full_path, 'rb'), start, length),
+        status=206, content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return set_cache_headers(response, etag, stat)
@@ -0,0 +1,96 @@
+"""Чтение лент из реплики с гарантией «видно своё».
+
+Представления, помеченные read_from_replica, читают из алиаса
+REPLICA_ALIAS - копии основной базы, которую обновляет команда
+refresh_replica. Все записи идут в основную базу. Клиент, чей запрос
+что-то записал, получает куку, и REPLICA_PIN_SECONDS секунд его
+запросы читают из основной базы, поэтому свой пост или лайк он видит
+сразу, даже пока реплика отстаёт.
+"""
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'pin_primary'
+# Сессии всегда из основной базы: иначе вход не виден до обновления
+# реплики
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def replica_enabled():
+    return REPLICA_ALIAS in connections.databases
+
+
+def reading_from_replica():
+    return getattr(_state, 'replica', False) and replica_enabled()
+
+
+@contextmanager
+def replica_reads():
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def read_from_replica(view):
+    """Запросы чтения представления идут в реплику.
+
+    Клиент, закреплённый за основной базой, читает из неё.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if getattr(request, 'pin_primary', False):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (reading_from_replica()
+                and model._meta.app_label not in PRIMARY_ONLY_APPS):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Явно основная база: иначе объект, прочитанный из реплики,
+        # сохранялся бы туда же
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        return {obj1._state.db, obj2._state.db} <= {
+            DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает в реплику вместе с данными при копировании
+        return db != REPLICA_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет за основной базой клиента, который только что писал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.pin_primary = PIN_COOKIE in request.COOKIES
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote and replica_enabled():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,58 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Одинаковые по содержимому форматы с разными расширениями
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+def content_hash(content, chunk_size=64 * 1024):
+    """SHA-256 файла, прочитанного по частям, без загрузки в память."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(chunk_size):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """posts/photo.JPEG -> posts/ab/cd/abcd...ef.jpg"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    extension = EXTENSION_ALIASES.get(extension, extension)
+    return os.path.join(directory, digest[:2], digest[2:4],
+                        digest + extension)
+
+
+def is_hashed_name(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    parts = name.split('/')
+    return (
+        len(stem) == 64 and len(parts) >= 3
+        and parts[-3] == stem[:2] and parts[-2] == stem[2:4]
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла - хеш его содержимого.
+
+    Повторная загрузка того же файла не создаёт копию: возвращается
+    имя уже сохранённого, и у всех постов с ним общие файл и миниатюры.
+    Удалять файл можно, только когда на него не ссылается ни один пост,
+    см. posts.media.
+    """
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            # Свежее время изменения защищает файл от сборки мусора,
+            # пока новая ссылка на него не зафиксирована
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
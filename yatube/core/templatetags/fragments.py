@@ -0,0 +1,11 @@
+from django import template
+
+from posts.fragments import place_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, name, arg=''):
+    """Персональная часть страницы: шапка, кнопки лайка и подписки."""
+    return place_fragment(context['request'], name, arg)
@@ -0,0 +1,36 @@
+from django import template
+
+from posts.thumbnails import get_preset, get_ready_variants, picture_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/post_image.html', takes_context=True)
+def post_image(context, image, preset, alt=''):
+    """<picture> с вариантами миниатюры; пока их нет - сама картинка.
+
+    Ленты заранее читают миниатюры всей страницы в post_thumbnails,
+    остальные страницы ищут миниатюру картинки отдельно. Размеры и
+    превью, сохранённые в посте, резервируют место до загрузки.
+    """
+    width, height, sizes = get_preset(preset)
+    post = getattr(image, 'instance', None)
+    image_context = {
+        'image': image,
+        'alt': alt,
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+        'image_width': getattr(post, 'image_width', None),
+        'image_height': getattr(post, 'image_height', None),
+        'placeholder': getattr(post, 'image_placeholder', ''),
+    }
+    prefetched = context.get('post_thumbnails') or {}
+    if image and image.name in prefetched:
+        ready = prefetched[image.name]
+    else:
+        ready = get_ready_variants(image, preset)
+    if ready:
+        image_context['sources'], image_context['fallback'] = (
+            picture_sources(ready))
+    return image_context
@@ -1,10 +1,9 @@
 from django import template
+from django.conf import settings
 
 # В template.Library зарегистрированы все встроенные теги и фильтры шаблонов;
 # добавляем к ним и наш фильтр.
 
-from posts.models import Like
-
 register = template.Library()
 
 
@@ -14,6 +13,9 @@ def addclass(field, css):
 
 
 @register.filter
-def like_filter(value, arg):
-    return (arg.is_authenticated and
-            Like.objects.filter(post=value, user=arg))
+def page_window(page, size=None):
+    """Номера страниц вокруг текущей вместо полного page_range."""
+    size = settings.PAGINATOR_WINDOW if size is None else int(size)
+    first = max(page.number - size, 1)
+    last = min(page.number + size, page.paginator.num_pages)
+    return range(first, last + 1)
@@ -0,0 +1,40 @@
+"""Запуск тестов со своим файлом кеша.
+
+Тесты сбрасывают кеш и пишут в него, поэтому manage.py test (через
+TEST_RUNNER) и pytest (через conftest.py) подменяют LOCATION кеша
+default временным файлом, а не общим с работающим сайтом.
+"""
+import shutil
+import tempfile
+from contextlib import contextmanager
+from os import path
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+@contextmanager
+def temp_cache():
+    """Кеш default во временном файле, удаляемом по выходе."""
+    cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+    location = path.join(cache_dir, 'cache.sqlite3')
+    caches = dict(settings.CACHES)
+    caches['default'] = dict(caches['default'], LOCATION=location)
+    try:
+        # смена CACHES сбрасывает уже созданные объекты кеша
+        with override_settings(CACHES=caches):
+            yield location
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+class TempCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.temp_cache = temp_cache()
+        self.temp_cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.temp_cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,244 @@
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, override_settings
+
+from .cache import TwoTierCache
+from .db.base import DatabaseWrapper
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_cache(self, **options):
+        # Два экземпляра на одном файле изображают два воркера
+        options.setdefault('SYNC_INTERVAL', 0)
+        return TwoTierCache(self.path, {'OPTIONS': options})
+
+    def test_set_get_and_tiers(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set('key', {'value': 1})
+        self.assertEqual(first.get('key'), {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertEqual(second.get('key'), {'value': 1})
+        self.assertIsNone(second.get('missing'))
+        self.assertEqual(first.get_stats()['l1']['hits'], 1)
+        stats = second.get_stats()
+        self.assertEqual(stats['l1'], {'hits': 1, 'misses': 2, 'entries': 1})
+        self.assertEqual(stats['l2'], {'hits': 1, 'misses': 1})
+
+    def test_invalidation_reaches_other_workers(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'new')
+        first.delete('key')
+        self.assertIsNone(second.get('key'))
+        second.set('other', 1)
+        first.clear()
+        self.assertIsNone(second.get('other'))
+
+    def test_invalidation_delay_is_bounded(self):
+        first = self.make_cache()
+        second = self.make_cache(SYNC_INTERVAL=0.2)
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'old')
+        time.sleep(0.25)
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_pruned_changes_reset_l1(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        first.set('other', 1)
+        # Журнал вычищен раньше, чем second его прочитал
+        first.changes_ttl = -1
+        first._prune(first._db)
+        self.assertEqual(second.get('key'), 'new')
+        # После сброса L1 снова работает
+        self.assertEqual(second.get('key'), 'new')
+        self.assertEqual(second.get_stats()['l1']['hits'], 1)
+
+    def test_tests_do_not_use_site_cache(self):
+        self.assertNotEqual(
+            os.path.realpath(caches['default'].path),
+            os.path.realpath(os.path.join(settings.BASE_DIR, 'cache.sqlite3')),
+        )
+
+    def test_l1_is_bounded_lru(self):
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get_stats()['l1']['entries'], 2)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(cache.get_stats()['l2']['hits'], 1)
+
+    def test_add_incr_and_timeouts(self):
+        cache = self.make_cache()
+        self.assertTrue(cache.add('counter', 1))
+        self.assertFalse(cache.add('counter', 5))
+        self.assertEqual(cache.incr('counter', 2), 3)
+        cache.set('short', 'value', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('short'))
+        self.assertTrue(cache.add('short', 'again'))
+        cache.set('forever', 'value', None)
+        self.assertEqual(cache.get('forever'), 'value')
+
+
+class MediaServingTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp_dir, 'posts'))
+        self.content = bytes(range(256)) * 40
+        with open(os.path.join(self.tmp_dir, 'posts', 'a.jpg'), 'wb') as f:
+            f.write(self.content)
+        override = override_settings(MEDIA_ROOT=self.tmp_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.url = '/media/posts/a.jpg'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_full_file_with_cache_headers(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_with_file(self):
+        etag = self.client.get(self.url)['ETag']
+        path = os.path.join(self.tmp_dir, 'posts', 'a.jpg')
+        with open(path, 'ab') as f:
+            f.write(b'!')
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=100-': (100, len(self.content) - 1),
+            'bytes=-5': (len(self.content) - 5, len(self.content) - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content),
+                                 self.content[start:end + 1])
+                self.assertEqual(
+                    response['Content-Range'],
+                    f'bytes {start}-{end}/{len(self.content)}')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=999999-')
+        self.assertEqual(response.status_code, 416)
+        # Устаревший If-Range - отдаём файл целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9',
+                                   HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_unsafe_paths(self):
+        self.assertEqual(
+            self.client.get('/media/posts/none.jpg').status_code, 404)
+        self.assertEqual(
+            self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/posts/').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/a.jpg')
+        self.assertEqual(response.content, b'')
+        name = 'фото 50%?.jpg'
+        with open(os.path.join(self.tmp_dir, 'posts', name), 'wb') as f:
+            f.write(self.content)
+        response = self.client.get('/media/posts/' + quote(name))
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/posts/%D1%84%D0%BE%D1%82%D0%BE%2050%25%3F.jpg')
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'db.sqlite3')
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_wrapper(self, **pragmas):
+        settings_dict = dict(connection.settings_dict, NAME=self.path,
+                             OPTIONS={'pragmas': pragmas})
+        wrapper = DatabaseWrapper(settings_dict, alias='test_wal')
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        wrapper = self.make_wrapper(cache_size=-1024)
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -1024)
+
+    def test_writer_does_not_block_readers(self):
+        writer = self.make_wrapper()
+        reader = self.make_wrapper(busy_timeout=0)
+        other_writer = self.make_wrapper(busy_timeout=0)
+        with writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE likes (id INTEGER PRIMARY KEY)')
+        writer._start_transaction_under_autocommit()
+        with writer.cursor() as cursor:
+            cursor.execute('INSERT INTO likes DEFAULT VALUES')
+        with reader.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM likes')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        # BEGIN IMMEDIATE занимает запись сразу, а не при первом INSERT
+        with self.assertRaises(OperationalError):
+            other_writer._start_transaction_under_autocommit()
+        with writer.cursor() as cursor:
+            cursor.execute('COMMIT')
+
+    def test_connection_inherited_by_fork_is_dropped(self):
+        wrapper = self.make_wrapper()
+        wrapper.ensure_connection()
+        inherited = wrapper.connection
+        wrapper.pid = -1
+        wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, inherited)
+        inherited.close()
@@ -1,3 +1,6 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.http import JsonResponse
 from django.shortcuts import render
 
 
@@ -17,3 +20,10 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def cache_stats(request):
+    # Счётчики у каждого воркера свои: ответ описывает только этот процесс
+    get_stats = getattr(cache, 'get_stats', None)
+    return JsonResponse(get_stats() if get_stats else {})
@@ -1,18 +1,26 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Like, Post
+from .search import matching_posts, search_enabled
 
 
 class PostAdmin(admin.ModelAdmin):
     # Перечисляем поля, которые должны отображаться в админке
     list_display = ('pk', 'title', 'text', 'pub_date', 'author', 'group',)
-    # Добавляем интерфейс для поиска по тексту постов
-    search_fields = ('text',)
+    # Добавляем интерфейс для поиска по заголовку и тексту постов
+    search_fields = ('title', 'text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('pub_date',)
     list_editable = ('group',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по полнотекстовому индексу вместо LIKE '%...%'
+        if not search_enabled():
+            return super().get_search_results(
+                request, queryset, search_term)
+        return matching_posts(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description',)
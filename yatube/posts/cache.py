@@ -0,0 +1,206 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.routers import reading_from_replica
+
+from .fragments import fill_fragments
+from .models import Group, User
+
+FEED_VERSION_KEY = 'feed_version:{scope}'
+FEED_PAGE_KEY = 'feed_page:{digest}'
+FEED_LOCK_KEY = 'feed_lock:{key}'
+
+GLOBAL_SCOPE = 'global'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def new_version():
+    # Случайный токен, а не счётчик: после очистки или рестарта кеша
+    # версия не может совпасть со старой и поднять устаревшую страницу
+    return uuid.uuid4().hex[:16]
+
+
+def get_versions(scopes):
+    keys = [FEED_VERSION_KEY.format(scope=scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, '') for key in keys]
+
+
+def bump_versions(scopes):
+    """Сбрасывает кешированные страницы лент scopes."""
+    cache.set_many(
+        {FEED_VERSION_KEY.format(scope=scope): new_version()
+         for scope in scopes},
+        None,
+    )
+
+
+def post_feed_scopes(author_id, group_ids):
+    """Ленты, в которых выводятся посты автора в группах group_ids."""
+    usernames = User.objects.filter(pk=author_id).values_list(
+        'username', flat=True)
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True)
+    return (
+        [GLOBAL_SCOPE]
+        + [author_scope(username) for username in usernames]
+        + [group_scope(slug) for slug in slugs]
+    )
+
+
+def bump_post_feeds(author_id, group_ids):
+    bump_versions(post_feed_scopes(author_id, group_ids))
+
+
+def feed_page_key(request):
+    # Пользователь в ключ не входит: персональные части страницы
+    # подставляются после кеша, см. posts.fragments. Версии тоже не
+    # входят - они хранятся в записи, чтобы устаревшую страницу можно
+    # было отдать, пока другой запрос собирает новую
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return FEED_PAGE_KEY.format(digest=digest)
+
+
+def is_fresh(entry, versions, now):
+    """Свежа ли запись; с вероятностью, растущей к концу срока, - нет.
+
+    Раннее обновление (XFetch): чем дольше собиралась страница и чем
+    ближе срок, тем вероятнее один из запросов пересоберёт её заранее,
+    пока остальные ещё получают готовую.
+    """
+    if entry['versions'] != versions:
+        return False
+    beta = settings.FEED_EARLY_REFRESH_BETA
+    early = -entry['delta'] * beta * math.log(random.random() or 1e-12)
+    return now + early < entry['expires']
+
+
+def acquire_lock(key):
+    token = uuid.uuid4().hex
+    if cache.add(FEED_LOCK_KEY.format(key=key), token,
+                 settings.FEED_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    lock_key = FEED_LOCK_KEY.format(key=key)
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def wait_for_entry(key, versions):
+    """Ждёт страницу, которую собирает другой запрос."""
+    deadline = time.monotonic() + settings.FEED_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry['versions'] == versions:
+            return entry
+    return None
+
+
+def cached_response(entry, request):
+    return HttpResponse(
+        fill_fragments(entry['content'], request),
+        content_type=entry['content_type'],
+    )
+
+
+def render_and_store(view, request, args, kwargs, key, versions):
+    started = time.time()
+    request.defer_fragments = True
+    try:
+        response = view(request, *args, **kwargs)
+    finally:
+        # Страница 404 из исключения представления собирается уже
+        # с обычными фрагментами
+        request.defer_fragments = False
+    if response.status_code != 200 or response.streaming:
+        return response
+    now = time.time()
+    fresh_for = settings.FEED_CACHE_TIMEOUT
+    if reading_from_replica():
+        # Реплика может отставать от версий лент: такая страница
+        # живёт не дольше окна, за которое реплика догоняет
+        fresh_for = min(fresh_for, settings.REPLICA_PIN_SECONDS)
+    # Устаревшая запись хранится дольше срока свежести, чтобы её было
+    # что отдать на время пересборки
+    cache.set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'versions': versions,
+        'delta': now - started,
+        'expires': now + fresh_for,
+    }, fresh_for + settings.FEED_STALE_TIMEOUT)
+    response.content = fill_fragments(response.content, request)
+    return response
+
+
+def cache_feed(get_scopes):
+    """Кеширует страницу ленты до изменения её содержимого.
+
+    get_scopes(**kwargs) возвращает области ленты (вся лента, группа,
+    автор); запись хранит их версии, а сигналы моделей поднимают версии
+    при любых изменениях постов, лайков, комментариев и подписок.
+
+    Пересобирает устаревшую страницу только запрос, взявший блокировку;
+    остальные тем временем получают прежнюю версию. Если прежней нет,
+    они недолго ждут готовую страницу, а затем собирают её сами.
+
+    В кеш попадает одна общая для всех посетителей страница с метками
+    на месте персональных фрагментов; они заполняются при каждом ответе.
+
+    Клиент, закреплённый за основной базой (см. core.routers), кеш не
+    читает: страницу под новыми версиями мог собрать запрос из
+    отстающей реплики, и в ней не было бы только что записанного.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = feed_page_key(request)
+            versions = get_versions(get_scopes(**kwargs))
+            if getattr(request, 'pin_primary', False):
+                return render_and_store(
+                    view, request, args, kwargs, key, versions
+                )
+            entry = cache.get(key)
+            if entry is not None and is_fresh(entry, versions, time.time()):
+                return cached_response(entry, request)
+            token = acquire_lock(key)
+            if token is None:
+                if entry is None:
+                    entry = wait_for_entry(key, versions)
+                if entry is not None:
+                    return cached_response(entry, request)
+            try:
+                return render_and_store(
+                    view, request, args, kwargs, key, versions
+                )
+            finally:
+                if token is not None:
+                    release_lock(key, token)
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+from django.db import transaction
+from django.db.models import (Count, F, IntegerField, OuterRef, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+
+from .models import (COUNTER_FIELDS, AuthorStats, Comment, Follow, Like,
+                     Post, User)
+
+
+def count_subquery(model, field='post'):
+    """Подзапрос, считающий записи модели, связанные полем field."""
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(
+        Subquery(counts, output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def change_post_counter(post_id, field, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(**{f'{field}__gte': -delta})
+    posts.update(**{field: F(field) + delta})
+
+
+def change_author_counter(author_id, field, delta):
+    if delta > 0:
+        AuthorStats.objects.get_or_create(author_id=author_id)
+    stats = AuthorStats.objects.filter(author_id=author_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    stats.update(**{field: F(field) + delta})
+
+
+def get_author_counter(author, field):
+    count = AuthorStats.objects.filter(author=author).values_list(
+        field, flat=True
+    ).first()
+    return count or 0
+
+
+def get_posts_count(author):
+    return get_author_counter(author, 'posts_count')
+
+
+def get_followers_count(author):
+    return get_author_counter(author, 'followers_count')
+
+
+def repair_post_counters(batch_size):
+    """Пересчитывает счётчики постов пачками по pk, чинит расхождения.
+
+    Возвращает (число проверенных постов, число исправленных).
+    """
+    checked = fixed = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .annotate(
+                    real_likes=count_subquery(Like),
+                    real_comments=count_subquery(Comment),
+                )
+                .values_list('pk', *COUNTER_FIELDS,
+                             'real_likes', 'real_comments')
+                [:batch_size]
+            )
+            if not batch:
+                return checked, fixed
+            drifted = [
+                Post(pk=pk, likes_count=real_likes,
+                     comments_count=real_comments)
+                for pk, likes, comments, real_likes, real_comments in batch
+                if (likes, comments) != (real_likes, real_comments)
+            ]
+            Post.objects.bulk_update(drifted, COUNTER_FIELDS)
+        checked += len(batch)
+        fixed += len(drifted)
+        last_pk = batch[-1][0]
+
+
+def repair_author_counters(batch_size):
+    """То же для числа постов и числа подписчиков авторов."""
+    checked = fixed = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                User.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .annotate(
+                    real_posts=count_subquery(Post, 'author'),
+                    real_followers=count_subquery(Follow, 'author'),
+                )
+                .values_list('pk', 'stats__posts_count',
+                             'stats__followers_count',
+                             'real_posts', 'real_followers')
+                [:batch_size]
+            )
+            if not batch:
+                return checked, fixed
+            drifted = [
+                (pk, real_posts, real_followers)
+                for pk, posts, followers, real_posts, real_followers in batch
+                if (posts or 0, followers or 0) != (real_posts,
+                                                    real_followers)
+            ]
+            for pk, real_posts, real_followers in drifted:
+                AuthorStats.objects.update_or_create(
+                    author_id=pk,
+                    defaults={'posts_count': real_posts,
+                              'followers_count': real_followers},
+                )
+        checked += len(batch)
+        fixed += len(drifted)
+        last_pk = batch[-1][0]
@@ -0,0 +1,8 @@
+def annotate_feed(queryset):
+    """Лента постов, которую карточка поста выводит без доп. запросов.
+
+    Автор и группа подтягиваются через JOIN, счётчики лайков и
+    комментариев хранятся в самом посте, а кнопку «нравится» подставляет
+    posts.fragments по набору get_liked_post_ids.
+    """
+    return queryset.select_related('author', 'group')
@@ -1,9 +1,15 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
-from .models import Comment, Post
+from .ingest import ingest_image
+from .models import ChunkedUpload, Comment, Post
+from .uploads import discard_upload, open_upload
 
 
 class PostForm(forms.ModelForm):
+    # Токен картинки, загруженной частями, см. posts.uploads
+    upload_token = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Post
         fields = ('title', 'text', 'group', 'image')
@@ -17,6 +23,53 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.upload = None
+        self.upload_file = None
+
+    def clean_image(self):
+        # Новую картинку уменьшаем до хранения; уже сохранённую не трогаем
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return ingest_image(image)
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        token = cleaned_data.get('upload_token')
+        if token is None or 'image' in self.files:
+            return cleaned_data
+        upload = ChunkedUpload.objects.filter(
+            pk=token, user=self.user, completed=True).first()
+        if upload is None:
+            self.add_error('upload_token',
+                           'Загрузка картинки не найдена или не завершена.')
+            return cleaned_data
+        self.upload, self.upload_file = upload, open_upload(upload)
+        try:
+            # Загрузка частями минует поле формы: проверяем её так же,
+            # как файл из формы, вместе с расширением
+            image = self.fields['image'].clean(self.upload_file)
+            cleaned_data['image'] = ingest_image(image)
+        except forms.ValidationError as error:
+            self.add_error('image', error)
+        return cleaned_data
+
+    def full_clean(self):
+        super().full_clean()
+        if self.errors and self.upload_file is not None:
+            # Пост не сохранят, а загрузка останется для повторной
+            # отправки формы: открытый файл больше не нужен
+            self.upload_file.close()
+
+    def discard_upload(self):
+        """Удаляет прикреплённую загрузку, когда пост уже сохранён."""
+        if self.upload is not None:
+            self.upload_file.close()
+            discard_upload(self.upload)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
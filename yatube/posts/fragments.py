@@ -0,0 +1,87 @@
+import re
+
+from django.template.loader import render_to_string
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+
+from .likes import get_liked_post_ids
+from .models import Follow
+
+FRAGMENT_MARK = '<!--fragment:{name}:{arg}-->'
+FRAGMENT_RE = re.compile(r'<!--fragment:(\w+):([\w.@+-]*)-->')
+
+
+class FragmentRenderer:
+    """Отрисовывает персональные фрагменты страницы для одного запроса.
+
+    Общая часть страницы лент одинакова для всех посетителей и
+    кешируется целиком, а шапка, переключатель лент, кнопки «нравится»
+    и подписки вставляются в неё отдельно для каждого пользователя.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def liked_ids(self):
+        return get_liked_post_ids(self.request.user)
+
+    def is_following(self, username):
+        user = self.request.user
+        return user.is_authenticated and Follow.objects.filter(
+            user=user, author__username=username
+        ).exists()
+
+    def header(self, arg):
+        return render_to_string('includes/header.html', request=self.request)
+
+    def switcher(self, arg):
+        return render_to_string('posts/includes/switcher.html', {
+            'user': self.request.user,
+            'index': arg == 'index',
+            'follow': arg == 'follow',
+        })
+
+    def like(self, arg):
+        post_id = int(arg)
+        return render_to_string('posts/includes/like_button.html', {
+            'post_id': post_id,
+            'liked': post_id in self.liked_ids,
+        })
+
+    def follow(self, arg):
+        return render_to_string('posts/includes/follow_button.html', {
+            'author_username': arg,
+            'following': self.is_following(arg),
+        })
+
+    def render(self, name, arg):
+        return getattr(self, name)(arg)
+
+
+FRAGMENTS = ('header', 'switcher', 'like', 'follow')
+
+
+def get_renderer(request):
+    if not hasattr(request, '_fragment_renderer'):
+        request._fragment_renderer = FragmentRenderer(request)
+    return request._fragment_renderer
+
+
+def place_fragment(request, name, arg=''):
+    """Фрагмент на месте: метка при отложенной отрисовке, иначе HTML."""
+    if name not in FRAGMENTS:
+        raise ValueError(f'Неизвестный фрагмент: {name}')
+    arg = str(arg)
+    if getattr(request, 'defer_fragments', False):
+        return mark_safe(FRAGMENT_MARK.format(name=name, arg=arg))
+    return mark_safe(get_renderer(request).render(name, arg))
+
+
+def fill_fragments(content, request):
+    """Подставляет в общую страницу фрагменты текущего пользователя."""
+    renderer = get_renderer(request)
+    return FRAGMENT_RE.sub(
+        lambda match: renderer.render(match.group(1), match.group(2)),
+        content.decode(),
+    ).encode()
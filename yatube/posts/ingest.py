@@ -0,0 +1,135 @@
+"""Приём картинок постов: проверка, уменьшение и перекодирование.
+
+Оригинал больше IMAGE_MAX_SIDE не хранится: его заменяет копия
+ограниченного размера, и последующие проходы миниатюр декодируют
+уже её. Размеры читаются из заголовка до декодирования, поэтому
+«бомба» из огромной, но хорошо сжатой картинки отклоняется сразу.
+"""
+import base64
+import math
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms import ImageField
+from PIL import Image, ImageOps
+
+# Форматы, которые не перекодируются, если картинка не больше предела
+KEEP_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+# Ориентации EXIF, при которых картинка повёрнута на 90 градусов
+EXIF_ORIENTATION = 0x0112
+ROTATED = {5, 6, 7, 8}
+
+# Сторона превью, которое показывается до загрузки картинки
+PLACEHOLDER_SIDE = 16
+
+BOMB_MESSAGE = 'Слишком большое изображение: не больше %(limit)s Мп.'
+INVALID_MESSAGE = ImageField.default_error_messages['invalid_image']
+
+
+def open_header(file):
+    """Открывает картинку, прочитав только заголовок."""
+    file.seek(0)
+    limit = settings.IMAGE_MAX_PIXELS
+    params = {'limit': limit // 10 ** 6}
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            image = Image.open(file)
+        except (Image.DecompressionBombWarning,
+                Image.DecompressionBombError):
+            raise ValidationError(BOMB_MESSAGE, code='too_large',
+                                  params=params)
+    width, height = image.size
+    if width * height > limit:
+        raise ValidationError(BOMB_MESSAGE, code='too_large', params=params)
+    return image
+
+
+def decode_bounded(image, max_side):
+    """Декодирует картинку не крупнее, чем нужно для max_side.
+
+    JPEG в режиме draft масштабируется декодером в 2, 4 или 8 раз, так
+    что полный растр в памяти не собирается. Возвращает уменьшенную
+    картинку и размер декодированного растра в байтах.
+    """
+    scale = max_side / max(image.size)
+    if image.format == 'JPEG' and scale < 1:
+        image.draft(image.mode, (math.ceil(image.width * scale),
+                                 math.ceil(image.height * scale)))
+    image.load()
+    decoded_bytes = image.width * image.height * len(image.getbands())
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image, decoded_bytes
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def ingest_image(uploaded):
+    """Картинка для сохранения: исходная или уменьшенная копия.
+
+    Небольшие картинки известных форматов, в том числе анимированные
+    GIF, сохраняются как есть. Остальные уменьшаются до IMAGE_MAX_SIDE
+    и перекодируются в JPEG, а с прозрачностью - в PNG.
+    """
+    max_side = settings.IMAGE_MAX_SIDE
+    try:
+        image = open_header(uploaded)
+        if max(image.size) <= max_side and image.format in KEEP_FORMATS:
+            uploaded.seek(0)
+            return uploaded
+        image, _ = decode_bounded(image, max_side)
+    except OSError:
+        # Не картинка или обрезанный файл, который не декодируется
+        raise ValidationError(INVALID_MESSAGE, code='invalid_image')
+    buffer = BytesIO()
+    if has_alpha(image):
+        image.save(buffer, 'PNG', optimize=True)
+        extension, content_type = 'png', 'image/png'
+    else:
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True, progressive=True,
+        )
+        extension, content_type = 'jpg', 'image/jpeg'
+    stem = os.path.splitext(os.path.basename(uploaded.name))[0]
+    return SimpleUploadedFile(f'{stem}.{extension}', buffer.getvalue(),
+                              content_type=content_type)
+
+
+def image_metadata(file):
+    """Ширина, высота и крошечное превью картинки в виде data: URI.
+
+    Превью - уменьшенная до PLACEHOLDER_SIDE копия в base64, которую
+    страница показывает на месте картинки, пока та не загрузилась.
+    Если файл не читается как картинка, возвращает (None, None, '').
+    """
+    try:
+        file.seek(0)
+        image = Image.open(file)
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+            width, height = height, width
+        image, _ = decode_bounded(image, PLACEHOLDER_SIDE)
+        buffer = BytesIO()
+        if has_alpha(image):
+            image.convert('RGBA').save(buffer, 'PNG', optimize=True)
+            mime_type = 'image/png'
+        else:
+            image.convert('RGB').save(buffer, 'JPEG', quality=40)
+            mime_type = 'image/jpeg'
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None, ''
+    finally:
+        file.seek(0)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:{mime_type};base64,{data}'
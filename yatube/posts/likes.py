@@ -0,0 +1,31 @@
+from array import array
+
+from django.core.cache import cache
+
+from .models import Like
+
+LIKED_POSTS_KEY = 'liked_posts:{user_id}'
+# Набор живёт, пока пользователь не поставит или не снимет лайк
+LIKED_POSTS_TIMEOUT = 60 * 60 * 24
+
+
+def get_liked_post_ids(user):
+    """id постов, которые нравятся user, одним множеством.
+
+    В кеше набор хранится компактным массивом целых чисел, из базы
+    загружается одним запросом только при промахе.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = LIKED_POSTS_KEY.format(user_id=user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = array('L', sorted(
+            Like.objects.filter(user=user).values_list('post_id', flat=True)
+        ))
+        cache.set(key, ids, LIKED_POSTS_TIMEOUT)
+    return frozenset(ids)
+
+
+def forget_liked_posts(user_id):
+    cache.delete(LIKED_POSTS_KEY.format(user_id=user_id))
@@ -0,0 +1,164 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+
+from posts.feeds import annotate_feed
+from posts.models import Post, User
+
+# Стандартный бэкенд и бэкенд проекта, см. core/db/base.py
+ENGINES = {
+    'sqlite3': 'django.db.backends.sqlite3',
+    'core.db': 'core.db',
+}
+
+
+def check_locked(error):
+    # Считаются только отказы из-за блокировки, остальное - ошибка
+    if 'locked' not in str(error):
+        raise error
+
+
+class Command(BaseCommand):
+    help = ('Меряет чтение первой страницы ленты, пока другие потоки '
+            'ставят и снимают лайки, на копии базы: стандартный '
+            'sqlite3 против core.db.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5,
+                            help='Секунд на каждый бэкенд.')
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+
+    def copy_database(self, path):
+        # Копия через backup API, чтобы не задеть рабочую базу
+        source = sqlite3.connect(connection.settings_dict['NAME'], uri=True)
+        target = sqlite3.connect(path)
+        source.backup(target)
+        # Оба бэкенда начинают с журнала по умолчанию
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.close()
+        source.close()
+
+    def add_alias(self, engine, path):
+        alias = f'bench_{engine}'
+        options = {} if engine == ENGINES['sqlite3'] else (
+            connection.settings_dict['OPTIONS'])
+        connections.databases[alias] = {
+            **connection.settings_dict,
+            'ENGINE': engine, 'NAME': path,
+            'CONN_MAX_AGE': 0, 'OPTIONS': options,
+        }
+        return alias
+
+    def read_feed(self, alias, deadline, stats, latencies):
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                list(annotate_feed(Post.objects.using(alias))
+                     [:settings.PAGE_COUNT])
+            except OperationalError as error:
+                check_locked(error)
+                stats['ошибок чтения'] += 1
+                continue
+            latencies.append(time.monotonic() - started)
+            stats['чтений'] += 1
+
+    def toggle_like(self, alias, user_id, post_id):
+        # Как лайк в приложении: проверка, запись и счётчик поста
+        # в одной транзакции
+        with transaction.atomic(using=alias):
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    'SELECT 1 FROM posts_like'
+                    ' WHERE user_id = %s AND post_id = %s',
+                    [user_id, post_id],
+                )
+                if cursor.fetchone():
+                    delta = -1
+                    cursor.execute(
+                        'DELETE FROM posts_like'
+                        ' WHERE user_id = %s AND post_id = %s',
+                        [user_id, post_id],
+                    )
+                else:
+                    delta = 1
+                    cursor.execute(
+                        'INSERT INTO posts_like (user_id, post_id)'
+                        ' VALUES (%s, %s)', [user_id, post_id],
+                    )
+                cursor.execute(
+                    'UPDATE posts_post SET likes_count = likes_count + %s'
+                    ' WHERE id = %s', [delta, post_id],
+                )
+
+    def write_likes(self, alias, deadline, stats, ids):
+        user_ids, post_ids = ids
+        while time.monotonic() < deadline:
+            try:
+                self.toggle_like(alias, random.choice(user_ids),
+                                 random.choice(post_ids))
+            except OperationalError as error:
+                check_locked(error)
+                stats['ошибок записи'] += 1
+                continue
+            stats['записей'] += 1
+
+    def run_threads(self, alias, duration, readers, writers, ids):
+        stats, latencies = Counter(), []
+        deadline = time.monotonic() + duration
+
+        def run(target, *args):
+            try:
+                target(alias, deadline, *args)
+            finally:
+                connections[alias].close()
+        threads = [
+            threading.Thread(target=run,
+                             args=(self.read_feed, stats, latencies))
+            for _ in range(readers)
+        ] + [
+            threading.Thread(target=run, args=(self.write_likes, stats, ids))
+            for _ in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats, latencies
+
+    def report(self, name, stats, latencies, duration):
+        p95 = (statistics.quantiles(latencies, n=20)[-1] * 1000
+               if len(latencies) > 1 else 0)
+        errors = stats['ошибок чтения'] + stats['ошибок записи']
+        self.stdout.write(
+            f'{name}: чтений {stats["чтений"] / duration:.1f}/с '
+            f'(p95 {p95:.1f} мс), записей {stats["записей"] / duration:.1f}/с'
+            f', ошибок {errors}'
+        )
+
+    def handle(self, *args, duration, readers, writers, **options):
+        ids = (list(User.objects.values_list('pk', flat=True)),
+               list(Post.objects.values_list('pk', flat=True)))
+        if not all(ids):
+            raise CommandError('Нужны хотя бы один пользователь и пост.')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, engine in ENGINES.items():
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.copy_database(path)
+                alias = self.add_alias(engine, path)
+                try:
+                    stats, latencies = self.run_threads(
+                        alias, duration, readers, writers, ids)
+                finally:
+                    connections[alias].close()
+                    del connections.databases[alias]
+                self.report(name, stats, latencies, duration)
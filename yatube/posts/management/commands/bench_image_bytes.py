@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+
+from posts.models import Post
+from posts.thumbnails import (backend, generate_thumbnails, get_preset,
+                              get_ready_variants)
+from yatube.settings import PAGE_COUNT
+
+
+def pick(thumbnails, needed):
+    """Вариант, который браузер выберет из srcset под нужную ширину."""
+    thumbnails = sorted(thumbnails, key=lambda item: item.width)
+    for thumbnail in thumbnails:
+        if thumbnail.width >= needed:
+            return thumbnail
+    return thumbnails[-1]
+
+
+class Command(BaseCommand):
+    help = ('Считает байты картинок на странице ленты: одна миниатюра '
+            'на всех против вариантов srcset в WebP и JPEG.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--viewports', default='360,768,1280',
+            help='Ширины экранов в CSS-пикселях через запятую.',
+        )
+        parser.add_argument(
+            '--dpr', type=float, default=1.0,
+            help='Плотность пикселей экрана.',
+        )
+        parser.add_argument('--preset', default='card')
+
+    def measure(self, post, preset, width, height):
+        """Размер прежней миниатюры и варианты srcset по форматам.
+
+        Для картинки, миниатюры которой не создаются (файла нет или он
+        не читается), возвращает None.
+        """
+        name = post.image.name
+        generate_thumbnails(name)
+        # Готовые варианты читаются без постановки в очередь
+        ready = get_ready_variants(post.image, preset, schedule=False)
+        if ready is None:
+            return None
+        # Прежняя разметка: одна миниатюра рамки в формате по умолчанию
+        legacy = backend.get_thumbnail(
+            name, f'{width}x{height}', upscale=True)
+        try:
+            legacy_size = default.storage.size(legacy.name)
+        except (OSError, TypeError, ValueError):
+            # Вместо миниатюры sorl вернул заглушку без файла
+            return None
+        by_format = {}
+        for variant, thumbnail in ready:
+            by_format.setdefault(variant.format, []).append(thumbnail)
+        return legacy_size, by_format
+
+    def handle(self, *args, viewports, dpr, preset, **options):
+        if preset not in settings.THUMBNAIL_PRESETS:
+            raise CommandError(f'Неизвестный пресет: {preset}')
+        viewports = [int(width) for width in viewports.split(',')]
+        width, height, _ = get_preset(preset)
+        # Страница ленты целиком из постов с картинками - худший случай
+        posts = Post.objects.exclude(image='')[:PAGE_COUNT]
+        legacy_total = counted = 0
+        totals = {viewport: {} for viewport in viewports}
+        for post in posts:
+            measured = self.measure(post, preset, width, height)
+            if measured is None:
+                self.stdout.write(
+                    f'Пропущен пост {post.pk}: картинка {post.image.name} '
+                    f'не читается'
+                )
+                continue
+            legacy_size, by_format = measured
+            legacy_total += legacy_size
+            counted += 1
+            for viewport in viewports:
+                needed = min(viewport, width) * dpr
+                for image_format, thumbnails in by_format.items():
+                    chosen = pick(thumbnails, needed)
+                    totals[viewport][image_format] = (
+                        totals[viewport].get(image_format, 0)
+                        + default.storage.size(chosen.name)
+                    )
+        if not legacy_total:
+            self.stdout.write('Нет постов с картинками')
+            return
+        self.stdout.write(
+            f'Картинок на странице: {counted}, '
+            f'одна миниатюра: {legacy_total / 1024:.1f} КБ'
+        )
+        for viewport, by_format in totals.items():
+            parts = [
+                f'{image_format} {size / 1024:.1f} КБ '
+                f'({(size - legacy_total) / legacy_total:+.0%})'
+                for image_format, size in by_format.items()
+            ]
+            self.stdout.write(
+                f'Экран {viewport}px x{dpr:g}: ' + ', '.join(parts)
+            )
@@ -0,0 +1,347 @@
+import json
+import random
+import subprocess
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+from yatube.wsgi import application
+
+# target - что нужно маршруту: ничего, группа, автор, пост, свой пост
+# (запрос идёт от его автора) или поисковое слово; auth - только для
+# вошедших
+Route = namedtuple('Route', 'url_name target auth', defaults=(None, False))
+
+# Все маршруты posts, users и about, которые можно вызвать GET-запросом.
+# Не вызываются: POST-формы (комментарий, загрузка частями), выход -
+# он закрыл бы сессию, и ссылка сброса пароля - ей нужен токен из
+# письма
+ROUTES = {
+    'index': Route('posts:index'),
+    'group_posts': Route('posts:group_posts', 'group'),
+    'profile': Route('posts:profile', 'author'),
+    'post_detail': Route('posts:post_detail', 'post'),
+    'post_create': Route('posts:post_create', auth=True),
+    'post_edit': Route('posts:post_edit', 'own_post', auth=True),
+    'search': Route('posts:search', 'query'),
+    'search_json': Route('posts:search_json', 'query'),
+    'follow_index': Route('posts:follow_index', auth=True),
+    # Ссылки лайка и подписки пишут в базу
+    'post_like': Route('posts:post_like', 'post', True),
+    'post_dislike': Route('posts:post_dislike', 'post', True),
+    'profile_follow': Route('posts:profile_follow', 'author', True),
+    'profile_unfollow': Route('posts:profile_unfollow', 'author', True),
+    'signup': Route('users:signup'),
+    'login': Route('users:login'),
+    'password_reset': Route('users:password_reset'),
+    'password_reset_done': Route('users:password_reset_done'),
+    'password_reset_complete': Route('users:password_reset_complete'),
+    'password_change': Route('users:password_change', auth=True),
+    'password_change_done': Route('users:password_change_done', auth=True),
+    'about_author': Route('about:author'),
+    'about_tech': Route('about:tech'),
+}
+# Веса маршрутов в сценарии - доли запросов
+SCENARIOS = {
+    'browse': {
+        'index': 30, 'post_detail': 25, 'profile': 15, 'group_posts': 10,
+        'follow_index': 10, 'search': 5, 'about_author': 1, 'about_tech': 1,
+        'login': 1,
+    },
+    'social': {
+        'index': 20, 'post_detail': 20, 'follow_index': 20,
+        'post_like': 10, 'post_dislike': 10, 'profile_follow': 5,
+        'profile_unfollow': 5, 'profile': 10,
+    },
+    'all': {name: 1 for name in ROUTES},
+}
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+HISTOGRAM_WIDTH = 40
+
+Sample = namedtuple('Sample', 'route status latency queries')
+
+
+def percentile(values, share):
+    """Значение с рангом share (0..1) в отсортированном списке."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def histogram(latencies):
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for latency in latencies:
+        position = sum(1 for bound in HISTOGRAM_BOUNDS if latency > bound)
+        counts[position] += 1
+    return counts
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample.latency for sample in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample.status >= 400),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'queries': (sum(sample.queries for sample in samples)
+                    / len(samples) if samples else 0.0),
+        'histogram': histogram(latencies),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_weights(scenario, overrides):
+    weights = dict(SCENARIOS[scenario])
+    for override in overrides:
+        name, _, weight = override.partition('=')
+        if name not in ROUTES or not weight.isdigit():
+            raise CommandError(f'Неверный вес маршрута: {override}')
+        weights[name] = int(weight)
+    weights = {name: weight for name, weight in weights.items() if weight}
+    if not weights:
+        raise CommandError('В сценарии не осталось маршрутов.')
+    return weights
+
+
+class Command(BaseCommand):
+    help = ('Нагружает WSGI-приложение в потоках по взвешенному сценарию '
+            'маршрутов и меряет задержки, пропускную способность и число '
+            'запросов к базе. Сценарии social и all пишут в базу: '
+            'запускайте на копии, например заполненной командой seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS),
+                            default='browse')
+        parser.add_argument(
+            '--weight', action='append', dest='weights', default=[],
+            help='Вес маршрута вида post_detail=10; 0 убирает маршрут.',
+        )
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--warmup', type=int, default=50,
+                            help='Запросов до замера, в итог не входят.')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--auth-share', type=float, default=0.3,
+            help='Доля вошедших пользователей на общих маршрутах.',
+        )
+        parser.add_argument('--users', type=int, default=50,
+                            help='Сколько пользователей входят на сайт.')
+        parser.add_argument('--sample', type=int, default=1000,
+                            help='Из скольких свежих постов выбирать.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear-cache', action='store_true',
+                            help='Очистить кеш перед прогревом.')
+        parser.add_argument('--output', help='Сохранить итог в JSON.')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения.')
+
+    def load_targets(self, sample):
+        posts = list(Post.objects.order_by('-pk').values_list(
+            'pk', 'author_id', 'author__username', 'title')[:sample])
+        if not posts:
+            raise CommandError('Нужны посты, например: manage.py seed.')
+        words = sorted({
+            word for post in posts for word in post[3].split() if word
+        }) or ['пост']
+        return {
+            'posts': posts,
+            'groups': list(
+                Group.objects.values_list('slug', flat=True)[:sample]),
+            'words': words,
+        }
+
+    def login(self, user):
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def session_for(self, user_id):
+        if user_id not in self.sessions:
+            self.sessions[user_id] = self.login(User.objects.get(pk=user_id))
+        return self.sessions[user_id]
+
+    def target_url(self, rng, route, targets):
+        """Адрес маршрута и пользователь, от которого идёт запрос."""
+        post_id, author_id, username, _ = rng.choice(targets['posts'])
+        if route.target == 'own_post':
+            return reverse(route.url_name, args=[post_id]), author_id
+        args = {
+            'group': lambda: [rng.choice(targets['groups'])],
+            'author': lambda: [username],
+            'post': lambda: [post_id],
+        }.get(route.target, lambda: [])()
+        url = reverse(route.url_name, args=args)
+        if route.target == 'query':
+            url += '?' + urlencode({'q': rng.choice(targets['words'])})
+        return url, None
+
+    def build_plan(self, count, weights, options):
+        """Заранее выбирает маршруты, адреса и пользователей запросов."""
+        rng = random.Random(options['seed'])
+        targets = self.load_targets(options['sample'])
+        if weights.get('group_posts') and not targets['groups']:
+            raise CommandError('Для group_posts нужны группы.')
+        user_ids = list(User.objects.filter(is_active=True).order_by(
+            'pk').values_list('pk', flat=True)[:options['users']])
+        names = list(weights)
+        plan = []
+        for name in rng.choices(names, [weights[n] for n in names], k=count):
+            route = ROUTES[name]
+            url, user_id = self.target_url(rng, route, targets)
+            signed_in = route.auth or rng.random() < options['auth_share']
+            if user_id is None and signed_in and user_ids:
+                user_id = rng.choice(user_ids)
+            if route.auth and user_id is None:
+                raise CommandError(f'Для {name} нужны пользователи.')
+            cookie = self.session_for(user_id) if user_id else None
+            plan.append((name, url, cookie))
+        return plan
+
+    def call(self, name, url, cookie):
+        path, _, query = url.partition('?')
+        environ = {
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'HTTP_HOST': settings.ALLOWED_HOSTS[0],
+        }
+        if cookie:
+            environ['HTTP_COOKIE'] = (
+                f'{settings.SESSION_COOKIE_NAME}={cookie}')
+        setup_testing_defaults(environ)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+        with ExitStack() as stack:
+            # Запросы считаются во всех базах, включая реплику.
+            # CaptureQueriesContext не годится: он отключает
+            # reset_queries, упирается в предел queries_log и
+            # переподключает глобальный сигнал из соседних потоков
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            started = time.perf_counter()
+            result = application(environ, start_response)
+            try:
+                for _ in result:
+                    pass
+            finally:
+                result.close()
+            latency = (time.perf_counter() - started) * 1000
+        return Sample(name, statuses[0], latency, queries)
+
+    def run(self, plan, threads):
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(lambda item: self.call(*item), plan))
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"маршрут":<24}{"запросов":>9}{"p50":>9}{"p95":>9}'
+            f'{"p99":>9}{"к БД":>7}{"ошибок":>8}'
+        )
+        for name, stats in sorted(results['routes'].items()):
+            self.stdout.write(
+                f'{name:<24}{stats["requests"]:>9}{stats["p50"]:>9.1f}'
+                f'{stats["p95"]:>9.1f}{stats["p99"]:>9.1f}'
+                f'{stats["queries"]:>7.1f}{stats["errors"]:>8}'
+            )
+        total = results['total']
+        self.stdout.write(
+            f'Всего: {total["requests"]} запросов, '
+            f'{total["throughput"]:.1f} запросов/с, p50 {total["p50"]:.1f}'
+            f' мс, p95 {total["p95"]:.1f} мс, p99 {total["p99"]:.1f} мс, '
+            f'{total["queries"]:.1f} запросов к БД на запрос, '
+            f'ошибок {total["errors"]}'
+        )
+        counts = total['histogram']
+        labels = [f'≤{bound} мс' for bound in HISTOGRAM_BOUNDS] + [
+            f'>{HISTOGRAM_BOUNDS[-1]} мс']
+        widest = max(counts) or 1
+        for label, count in zip(labels, counts):
+            bar = '#' * round(count / widest * HISTOGRAM_WIDTH)
+            self.stdout.write(f'{label:>10} {count:>7} {bar}')
+
+    def compare(self, results, path):
+        with open(path) as file:
+            previous = json.load(file)
+        self.stdout.write(
+            f'Сравнение с {previous.get("commit") or path} (p95, запросов/с):')
+        rows = [('всего', previous['total'], results['total'])] + [
+            (name, previous['routes'][name], stats)
+            for name, stats in sorted(results['routes'].items())
+            if name in previous['routes']
+        ]
+        for name, before, after in rows:
+            change = (after['p95'] / before['p95'] - 1) * 100 if (
+                before['p95']) else 0.0
+            self.stdout.write(
+                f'{name:<24}{before["p95"]:>9.1f} -> {after["p95"]:<9.1f}'
+                f'({change:+.0f}%) {before["throughput"]:.1f} -> '
+                f'{after["throughput"]:.1f}'
+            )
+
+    def handle(self, *args, **options):
+        self.sessions = {}
+        weights = parse_weights(options['scenario'], options['weights'])
+        plan = self.build_plan(options['warmup'] + options['requests'],
+                               weights, options)
+        if options['clear_cache']:
+            cache.clear()
+        self.run(plan[:options['warmup']], options['threads'])
+        started = time.perf_counter()
+        samples = self.run(plan[options['warmup']:], options['threads'])
+        elapsed = time.perf_counter() - started
+        by_route = {}
+        for sample in samples:
+            by_route.setdefault(sample.route, []).append(sample)
+        results = {
+            'commit': current_commit(),
+            'started': datetime.now(timezone.utc).isoformat(),
+            'options': {
+                key: options[key] for key in (
+                    'scenario', 'requests', 'warmup', 'threads',
+                    'auth_share', 'users', 'seed')
+            },
+            'weights': weights,
+            'histogram_bounds': HISTOGRAM_BOUNDS,
+            'total': summarize(samples, elapsed),
+            'routes': {
+                name: summarize(route_samples, elapsed)
+                for name, route_samples in by_route.items()
+            },
+        }
+        self.report(results)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.storage import content_hash, hashed_name, is_hashed_name
+from posts.cache import bump_post_feeds
+from posts.media import release_image
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по хешу содержимого: '
+            'одинаковые файлы сливаются в один, посты переключаются на него.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько имён файлов читать из БД за раз.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, что будет перенесено.',
+        )
+        parser.add_argument(
+            '--keep-originals', action='store_true',
+            help='Не удалять старые файлы после переноса.',
+        )
+
+    def convert(self, storage, old_name, keep_originals):
+        with storage.open(old_name, 'rb') as source:
+            content = File(source, old_name)
+            new_name = hashed_name(old_name, content_hash(content))
+            duplicate = storage.exists(new_name)
+            if not duplicate:
+                new_name = storage.save(old_name, content)
+        with transaction.atomic():
+            posts = Post.objects.filter(image=old_name)
+            owners = set(posts.values_list('author_id', 'group_id'))
+            posts.update(image=new_name)
+        if not keep_originals:
+            # Старое имя не по хешу: новая загрузка его не получит
+            release_image(old_name, storage, min_age=0)
+        return duplicate, owners
+
+    def handle(self, *args, batch_size, dry_run, keep_originals, **options):
+        storage = Post._meta.get_field('image').storage
+        names = (
+            Post.objects.exclude(image='')
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        stats = Counter()
+        feeds = defaultdict(set)
+        last_name = ''
+        # Имена читаются пачками по ключу, а не все сразу
+        while True:
+            batch = list(names.filter(image__gt=last_name)[:batch_size])
+            if not batch:
+                break
+            last_name = batch[-1]
+            for old_name in batch:
+                if is_hashed_name(old_name):
+                    stats['уже по хешу'] += 1
+                elif not storage.exists(old_name):
+                    stats['нет файла'] += 1
+                    self.stderr.write(f'Нет файла: {old_name}')
+                elif dry_run:
+                    stats['к переносу'] += 1
+                else:
+                    duplicate, owners = self.convert(
+                        storage, old_name, keep_originals)
+                    stats['дубликатов' if duplicate else 'перенесено'] += 1
+                    for author_id, group_id in owners:
+                        feeds[author_id].add(group_id)
+        # В кешированных лентах остались ссылки на старые имена
+        for author_id, group_ids in feeds.items():
+            bump_post_feeds(author_id, group_ids - {None})
+        report = ', '.join(f'{key}: {value}' for key, value in stats.items())
+        self.stdout.write(self.style.SUCCESS(report or 'Картинок нет'))
@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts.media import (find_orphan_images, find_orphan_thumbnails,
+                         find_stale_sources, image_storage, release_image)
+from posts.uploads import discard_upload, expired_uploads
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы картинок без постов, записи sorl о таких '
+            'картинках, файлы миниатюр, о которых sorl не знает, '
+            'и брошенные загрузки частями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов или записей проверять за раз.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+
+    def file_size(self, storage, name):
+        try:
+            return storage.size(name)
+        except OSError:
+            return 0
+
+    def collect_images(self, stats, batch_size, min_age, dry_run):
+        storage = image_storage()
+        for names in find_orphan_images(storage, batch_size, min_age):
+            for name in names:
+                size = self.file_size(storage, name)
+                # Между проверкой и удалением на файл могли сослаться
+                if dry_run or release_image(name, storage, min_age):
+                    self.stdout.write(f'Картинка без постов: {name}')
+                    stats['картинок'] += 1
+                    stats['байт'] += size
+
+    def collect_sources(self, stats, batch_size, dry_run):
+        # Вместе с записью sorl удаляет и файлы её миниатюр
+        for sources in find_stale_sources(batch_size):
+            for source in sources:
+                self.stdout.write(f'Миниатюры без поста: {source.name}')
+                stats['записей sorl'] += 1
+                if not dry_run:
+                    default.kvstore.delete(source)
+
+    def collect_thumbnails(self, stats, batch_size, min_age, dry_run):
+        storage = default.storage
+        for names in find_orphan_thumbnails(batch_size, min_age):
+            for name in names:
+                self.stdout.write(f'Лишняя миниатюра: {name}')
+                stats['миниатюр'] += 1
+                stats['байт'] += self.file_size(storage, name)
+                if not dry_run:
+                    storage.delete(name)
+
+    def collect_uploads(self, stats, dry_run):
+        for upload in expired_uploads().iterator():
+            self.stdout.write(f'Брошенная загрузка: {upload}')
+            stats['загрузок'] += 1
+            if not dry_run:
+                discard_upload(upload)
+
+    def handle(self, *args, batch_size, min_age, dry_run, **options):
+        stats = Counter()
+        self.collect_images(stats, batch_size, min_age, dry_run)
+        self.collect_sources(stats, batch_size, dry_run)
+        self.collect_thumbnails(stats, batch_size, min_age, dry_run)
+        self.collect_uploads(stats, dry_run)
+        report = ', '.join(f'{key}: {value}' for key, value in stats.items())
+        prefix = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}: {report}' if report else 'Мусора нет'
+        ))
@@ -0,0 +1,171 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.cache import bump_post_feeds
+from posts.ingest import image_metadata
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+def init_worker(niceness):
+    # При запуске процессов через spawn Django в них ещё не настроен
+    if not apps.ready:
+        django.setup()
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def generate(name, with_metadata=False):
+    """Миниатюры одной картинки и, если нужно, её размеры и превью.
+
+    Возвращает текст ошибки или None и поля метаданных для поста.
+    """
+    metadata = None
+    try:
+        generate_thumbnails(name)
+        if with_metadata:
+            storage = Post._meta.get_field('image').storage
+            with storage.open(name, 'rb') as file:
+                width, height, placeholder = image_metadata(file)
+            metadata = {
+                'image_width': width,
+                'image_height': height,
+                'image_placeholder': placeholder,
+            }
+    except Exception as error:
+        return f'{type(error).__name__}: {error}', metadata
+    return None, metadata
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return ''
+    with open(path, encoding='utf-8') as file:
+        return file.read().strip()
+
+
+def write_checkpoint(path, name):
+    # Замена файла атомарна: прерванный запуск не оставит его пустым
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(name)
+    os.replace(temp_path, path)
+
+
+class Command(BaseCommand):
+    help = ('Создаёт миниатюры всех пресетов THUMBNAIL_PRESETS '
+            'для уже загруженных картинок постов и заполняет '
+            'недостающие размеры и превью.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Сколько процессов создают миниатюры; 1 - без пула.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько картинок обрабатывать между контрольными точками.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с последней обработанной картинкой; '
+                 'прерванный запуск продолжится с неё.',
+        )
+        parser.add_argument(
+            '--max-rate', type=float, default=0,
+            help='Не больше стольких картинок в секунду; 0 - без ограничения.',
+        )
+        parser.add_argument(
+            '--nice', type=int, default=10,
+            help='Понижение приоритета процессов пула.',
+        )
+
+    def throttle(self, started, done, max_rate):
+        if max_rate:
+            delay = done / max_rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def make_pool(self, workers, nice):
+        if workers <= 1:
+            return None
+        # Дочерние процессы не должны делить соединения родителя
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(nice,),
+        )
+
+    def process_batch(self, pool, batch, feeds):
+        """Создаёт миниатюры пачки, возвращает число ошибок.
+
+        Заодно заполняет размеры и превью постов, сохранённых до их
+        появления.
+        """
+        missing = set(
+            Post.objects.filter(image__in=batch, image_width__isnull=True)
+            .values_list('image', flat=True)
+        )
+        flags = [name in missing for name in batch]
+        results = (map if pool is None else pool.map)(generate, batch, flags)
+        failed = 0
+        for name, (error, metadata) in zip(batch, results):
+            if error is not None:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            if metadata and metadata['image_width'] is not None:
+                Post.objects.filter(image=name).update(**metadata)
+        owners = Post.objects.filter(image__in=batch).values_list(
+            'author_id', 'group_id')
+        for author_id, group_id in owners:
+            feeds[author_id].add(group_id)
+        return failed
+
+    def handle(self, *args, workers, batch_size, checkpoint, max_rate,
+               nice, **options):
+        names = (
+            Post.objects.exclude(image='')
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        last_name = read_checkpoint(checkpoint)
+        if last_name:
+            self.stdout.write(f'Продолжение после {last_name}')
+        pool = self.make_pool(workers, nice)
+        done = failed = 0
+        feeds = defaultdict(set)
+        started = time.monotonic()
+        try:
+            while True:
+                batch = list(names.filter(image__gt=last_name)[:batch_size])
+                if not batch:
+                    break
+                failed += self.process_batch(pool, batch, feeds)
+                done += len(batch)
+                # Точка записывается только после всей пачки, поэтому
+                # при продолжении ни одна картинка не пропускается
+                last_name = batch[-1]
+                if checkpoint:
+                    write_checkpoint(checkpoint, last_name)
+                self.throttle(started, done, max_rate)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        # Ленты в кеше ссылаются на прежние миниатюры
+        for author_id, group_ids in feeds.items():
+            bump_post_feeds(author_id, group_ids - {None})
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок обработано: {done - failed}, ошибок: {failed}, '
+            f'{rate:.1f} картинок/с'
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.models import Post
+from posts.search import rebuild_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает полнотекстовый индекс постов, например после '
+            'массовых изменений в обход модели.')
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError('Полнотекстовый поиск требует SQLite FTS5')
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен, постов: {Post.objects.count()}'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.timelines import rebuild_all_timelines, rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Заполняет и пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Пересобрать ленту только этого пользователя.',
+        )
+
+    def handle(self, *args, usernames, **options):
+        if not usernames:
+            entries = rebuild_all_timelines()
+            self.stdout.write(
+                self.style.SUCCESS(f'Все ленты пересобраны, записей: '
+                                   f'{entries}')
+            )
+            return
+        user_ids = User.objects.filter(
+            username__in=usernames
+        ).values_list('pk', flat=True)
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            rebuild_timeline(user_id)
+            rebuilt += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересобрано лент: {rebuilt}')
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import repair_author_counters, repair_post_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики лайков, комментариев, постов '
+            'и подписчиков и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк проверять за одну транзакцию.',
+        )
+
+    def handle(self, *args, batch_size, **options):
+        checked, fixed = repair_post_counters(batch_size)
+        self.stdout.write(f'Посты: проверено {checked}, исправлено {fixed}')
+        checked, fixed = repair_author_counters(batch_size)
+        self.stdout.write(
+            f'Авторы: проверено {checked}, исправлено {fixed}'
+        )
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Обновляет реплику для чтения лент копией основной базы '
+            'через онлайн-бэкап SQLite.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд; 0 - обновить один раз.',
+        )
+
+    def refresh(self):
+        # Бэкап читает основную базу снимком и не мешает писателям в WAL;
+        # читатели реплики ждут окончания копирования по busy_timeout
+        source = sqlite3.connect(
+            connections[DEFAULT_DB_ALIAS].settings_dict['NAME'], uri=True)
+        target = sqlite3.connect(
+            connections[REPLICA_ALIAS].settings_dict['NAME'], uri=True,
+            timeout=30,
+        )
+        started = time.monotonic()
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return time.monotonic() - started
+
+    def handle(self, *args, interval, **options):
+        if REPLICA_ALIAS not in connections.databases:
+            raise CommandError(
+                'Реплика не настроена: задайте YATUBE_REPLICA_PATH.')
+        while True:
+            elapsed = self.refresh()
+            self.stdout.write(f'Реплика обновлена за {elapsed:.2f} с')
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,277 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.media import batched
+from posts.models import Comment, Follow, Group, Like, Post, User
+from posts.search import rebuild_index, search_enabled
+
+# Даты отсчитываются назад от постоянной точки: один и тот же --seed
+# даёт одни и те же данные в любой день
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+# Пароль всех созданных пользователей; хеш считается один раз
+PASSWORD = 'seed-password'
+WORDS = (
+    'утро город река лес дорога письмо друг дом окно небо море поезд '
+    'книга музыка кофе вечер снег солнце ветер сад кошка собака школа '
+    'работа отпуск горы озеро мост улица парк кино театр выставка '
+    'новый старый тихий быстрый тёплый холодный яркий первый последний '
+    'видеть писать читать думать ждать помнить гулять ехать строить '
+    'сегодня вчера снова очень почти всегда иногда рядом далеко'
+).split()
+
+
+def power_law(rng, ids, alpha):
+    """Выборка из ids с весами 1 / rank ** alpha.
+
+    Ранги раздаются в случайном порядке: популярны не первые
+    созданные записи, а случайные.
+    """
+    ids = list(ids)
+    rng.shuffle(ids)
+    weights = list(accumulate(
+        1 / rank ** alpha for rank in range(1, len(ids) + 1)))
+
+    def sample(count):
+        return rng.choices(ids, cum_weights=weights, k=count)
+    return sample
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # bulk_create заполняет auto_now_add текущим временем; даты
+    # распределяем сами
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, подписками, лайками и комментариями для '
+            'нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=200000)
+        parser.add_argument('--likes', type=int, default=500000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов '
+                 'и постов.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней до EPOCH разбросаны посты.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк вставлять за одну транзакцию.',
+        )
+
+    def insert(self, model, objects, batch_size, ignore_conflicts=False):
+        """Вставляет objects пачками; возвращает число новых строк."""
+        before = model.objects.count()
+        for batch in batched(objects, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    batch, ignore_conflicts=ignore_conflicts)
+        return model.objects.count() - before
+
+    @contextmanager
+    def step(self, label):
+        started = time.monotonic()
+        result = {}
+        yield result
+        elapsed = time.monotonic() - started
+        rows = result.get('rows')
+        if rows is None:
+            self.stdout.write(f'{label}: {elapsed:.1f} с')
+            return
+        self.stdout.write(
+            f'{label}: {rows} строк за {elapsed:.1f} с, '
+            f'{rows / max(elapsed, 1e-9):.0f} строк/с'
+        )
+        self.total += rows
+
+    def new_ids(self, model, last_pk):
+        return list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)
+        )
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+    def seed_users(self, rng, count, batch_size):
+        last_pk = self.last_pk(User)
+        if User.objects.filter(username__startswith='seed_').exists():
+            raise CommandError('В базе уже есть пользователи seed_*.')
+        password = make_password(PASSWORD, salt='yatubeseed')
+        users = (
+            User(username=f'seed_{number}', password=password,
+                 first_name=rng.choice(WORDS).capitalize())
+            for number in range(count)
+        )
+        rows = self.insert(User, users, batch_size)
+        return rows, self.new_ids(User, last_pk)
+
+    def seed_groups(self, rng, count, batch_size):
+        last_pk = self.last_pk(Group)
+        groups = (
+            Group(title=sentence(rng, 1, 3).capitalize(),
+                  slug=f'seed-{number}',
+                  description=sentence(rng, 5, 20))
+            for number in range(count)
+        )
+        rows = self.insert(Group, groups, batch_size)
+        return rows, self.new_ids(Group, last_pk)
+
+    def seed_posts(self, rng, count, options, user_ids, group_ids):
+        # Посты вставляются по порядку дат, как в жизни: id растёт
+        # вместе с pub_date
+        start = EPOCH.timestamp() - options['days'] * 86400
+        dates = array('d', sorted(
+            rng.uniform(start, EPOCH.timestamp()) for _ in range(count)))
+        authors = power_law(rng, user_ids, options['alpha'])
+        groups = power_law(rng, group_ids, options['alpha'])
+
+        def posts():
+            for offset in range(0, count, options['batch_size']):
+                chunk = dates[offset:offset + options['batch_size']]
+                for author_id, group_id, date in zip(
+                        authors(len(chunk)), groups(len(chunk)), chunk):
+                    yield Post(
+                        title=sentence(rng, 2, 6).capitalize(),
+                        text=sentence(rng, 5, 80),
+                        author_id=author_id,
+                        # Примерно треть постов без группы
+                        group_id=group_id if rng.random() < 0.7 else None,
+                        pub_date=datetime.fromtimestamp(date, timezone.utc),
+                    )
+        last_pk = self.last_pk(Post)
+        rows = self.insert(Post, posts(), options['batch_size'])
+        return rows, self.new_ids(Post, last_pk), dates
+
+    def seed_follows(self, rng, count, options, user_ids):
+        # Подписываются все понемногу, а подписчиков - степенной закон
+        authors = power_law(rng, user_ids, options['alpha'])
+
+        def follows():
+            for offset in range(0, count, options['batch_size']):
+                size = min(options['batch_size'], count - offset)
+                for user_id, author_id in zip(
+                        rng.choices(user_ids, k=size), authors(size)):
+                    if user_id != author_id:
+                        yield Follow(user_id=user_id, author_id=author_id)
+        # Повторные пары отбрасывает уникальный индекс
+        return self.insert(Follow, follows(), options['batch_size'],
+                           ignore_conflicts=True)
+
+    def seed_likes(self, rng, count, options, user_ids, post_ids):
+        posts = power_law(rng, post_ids, options['alpha'])
+
+        def likes():
+            for offset in range(0, count, options['batch_size']):
+                size = min(options['batch_size'], count - offset)
+                for user_id, post_id in zip(
+                        rng.choices(user_ids, k=size), posts(size)):
+                    yield Like(user_id=user_id, post_id=post_id)
+        return self.insert(Like, likes(), options['batch_size'],
+                           ignore_conflicts=True)
+
+    def seed_comments(self, rng, count, options, user_ids, post_ids, dates):
+        positions = power_law(rng, range(len(post_ids)), options['alpha'])
+
+        def comments():
+            for offset in range(0, count, options['batch_size']):
+                size = min(options['batch_size'], count - offset)
+                for user_id, position in zip(
+                        rng.choices(user_ids, k=size), positions(size)):
+                    # Комментарий - в течение недели после поста
+                    created = dates[position] + rng.expovariate(1 / 86400)
+                    yield Comment(
+                        post_id=post_ids[position], author_id=user_id,
+                        text=sentence(rng, 1, 30),
+                        created=datetime.fromtimestamp(
+                            min(created, dates[position] + 7 * 86400),
+                            timezone.utc),
+                    )
+        return self.insert(Comment, comments(), options['batch_size'])
+
+    def seed_rows(self, rng, options):
+        with self.step('Пользователи') as result:
+            result['rows'], user_ids = self.seed_users(
+                rng, options['users'], options['batch_size'])
+        with self.step('Группы') as result:
+            result['rows'], group_ids = self.seed_groups(
+                rng, options['groups'], options['batch_size'])
+        with self.step('Посты') as result:
+            result['rows'], post_ids, dates = self.seed_posts(
+                rng, options['posts'], options, user_ids, group_ids)
+        with self.step('Подписки') as result:
+            result['rows'] = self.seed_follows(
+                rng, options['follows'], options, user_ids)
+        if not post_ids:
+            return
+        with self.step('Лайки') as result:
+            result['rows'] = self.seed_likes(
+                rng, options['likes'], options, user_ids, post_ids)
+        with self.step('Комментарии') as result:
+            result['rows'] = self.seed_comments(
+                rng, options['comments'], options, user_ids, post_ids,
+                dates)
+
+    def rebuild_derived(self, batch_size):
+        # bulk_create не шлёт сигналы: счётчики, ленты подписок
+        # и поисковый индекс пересобираются целиком
+        with self.step('Счётчики'):
+            call_command('recount_counters', batch_size=batch_size,
+                         stdout=self.stdout)
+        with self.step('Ленты подписок'):
+            call_command('rebuild_timelines', stdout=self.stdout)
+        if search_enabled():
+            with self.step('Поисковый индекс'), transaction.atomic():
+                rebuild_index()
+        cache.clear()
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or (options['posts'] and not
+                                    options['groups']):
+            raise CommandError('Нужны хотя бы два пользователя и группа.')
+        rng = random.Random(options['seed'])
+        self.total = 0
+        started = time.monotonic()
+        post_date = Post._meta.get_field('pub_date')
+        comment_date = Comment._meta.get_field('created')
+        with explicit_dates(post_date, comment_date):
+            self.seed_rows(rng, options)
+        self.rebuild_derived(options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {self.total} за {elapsed:.1f} с, '
+            f'{self.total / max(elapsed, 1e-9):.0f} строк/с. '
+            f'Пароль пользователей seed_*: {PASSWORD}'
+        ))
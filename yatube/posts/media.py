@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from sorl import thumbnail
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+from .thumbnails import read_kvstore
+
+logger = logging.getLogger(__name__)
+
+# Каталог картинок постов в хранилище
+IMAGES_DIRECTORY = 'posts'
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def image_refcount(name):
+    """Сколько постов ссылается на файл картинки."""
+    return Post.objects.filter(image=name).count()
+
+
+def release_image(name, storage, min_age=None):
+    """Удаляет файл и его миниатюры, если на него больше нет ссылок.
+
+    Файл моложе min_age секунд (по умолчанию MEDIA_RELEASE_MIN_AGE)
+    остаётся на месте: хранилище по хешу могло только что отдать это
+    имя такой же загрузке, чей пост ещё не сохранён. Возвращает True,
+    если файл удалён.
+    """
+    if min_age is None:
+        min_age = settings.MEDIA_RELEASE_MIN_AGE
+    if not name or image_refcount(name):
+        return False
+    try:
+        if not is_settled(storage, name, min_age):
+            return False
+    except FileNotFoundError:
+        # Файла уже нет, остаются только миниатюры
+        pass
+    # Ключ sorl зависит от хранилища: с именем без него запись не найти
+    thumbnail.delete(ImageFile(name, storage), delete_file=False)
+    storage.delete(name)
+    return True
+
+
+def release_image_on_commit(name):
+    """Освобождает файл, когда удаление ссылки на него зафиксировано."""
+    storage = image_storage()
+
+    def release():
+        try:
+            release_image(name, storage)
+        except (OSError, SuspiciousFileOperation) as error:
+            # Например, ссылка на файл вне MEDIA_ROOT из старых данных
+            logger.warning('Не удалось удалить картинку %s: %s', name, error)
+    transaction.on_commit(release)
+
+
+def walk_files(storage, directory):
+    """Имена файлов каталога хранилища по одному, без списка в памяти."""
+    root = storage.path(directory)
+    for path, directories, files in os.walk(root):
+        directories.sort()
+        for file_name in sorted(files):
+            full_path = os.path.join(path, file_name)
+            yield os.path.relpath(full_path, storage.location).replace(
+                os.sep, '/')
+
+
+def batched(names, size):
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_settled(storage, name, min_age):
+    # Свежий файл может принадлежать посту, чья транзакция ещё идёт
+    return time.time() - os.path.getmtime(storage.path(name)) >= min_age
+
+
+def live_images(names):
+    return set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+
+
+def find_orphan_images(storage, batch_size, min_age):
+    """Пачки файлов картинок, на которые не ссылается ни один пост."""
+    for batch in batched(walk_files(storage, IMAGES_DIRECTORY), batch_size):
+        live = live_images(batch)
+        orphans = [
+            name for name in batch
+            if name not in live and is_settled(storage, name, min_age)
+        ]
+        if orphans:
+            yield orphans
+
+
+def find_stale_sources(batch_size):
+    """Пачки записей sorl о картинках, которых нет ни в одном посте.
+
+    Записи читаются по ключу порциями, а не все сразу.
+    """
+    prefix = add_prefix('', 'thumbnails')
+    keys = KVStoreModel.objects.filter(key__startswith=prefix).order_by(
+        'key').values_list('key', flat=True)
+    last_key = prefix
+    while True:
+        batch = list(keys.filter(key__gt=last_key)[:batch_size])
+        if not batch:
+            break
+        last_key = batch[-1]
+        values = read_kvstore([add_prefix(del_prefix(key)) for key in batch])
+        sources = [
+            deserialize_image_file(value)
+            for value in values.values() if value is not None
+        ]
+        live = live_images([source.name for source in sources])
+        stale = [source for source in sources if source.name not in live]
+        if stale:
+            yield stale
+
+
+def find_orphan_thumbnails(batch_size, min_age):
+    """Пачки файлов миниатюр, о которых sorl ничего не знает."""
+    storage = default.storage
+    directory = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+    for batch in batched(walk_files(storage, directory), batch_size):
+        keys = {add_prefix(ImageFile(name, storage).key): name
+                for name in batch}
+        known = set(
+            KVStoreModel.objects.filter(key__in=keys)
+            .values_list('key', flat=True)
+        )
+        orphans = [
+            name for key, name in keys.items()
+            if key not in known and is_settled(storage, name, min_age)
+        ]
+        if orphans:
+            yield orphans
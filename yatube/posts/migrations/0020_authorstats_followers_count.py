@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    counts = (
+        Follow.objects.order_by()
+        .values('author')
+        .annotate(count=Count('pk'))
+    )
+    AuthorStats.objects.update(followers_count=Coalesce(
+        Subquery(counts.filter(author=OuterRef('pk')).values('count'),
+                 output_field=models.IntegerField()),
+        Value(0),
+    ))
+    missing = counts.exclude(
+        author__in=AuthorStats.objects.values('author'))
+    AuthorStats.objects.bulk_create(
+        AuthorStats(author_id=pk, followers_count=count)
+        for pk, count in missing.values_list('author', 'count').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]
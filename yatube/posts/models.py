@@ -1,8 +1,17 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
+from .ingest import image_metadata
+
 User = get_user_model()
 
+# Счётчики меняются только атомарными UPDATE ... SET x = x + 1
+COUNTER_FIELDS = ('likes_count', 'comments_count')
+
 
 class Post(models.Model):
     title = models.CharField(max_length=200,)
@@ -24,19 +33,75 @@ class Post(models.Model):
         null=True,
         related_name='posts',
     )
-    # Поле для картинки (необязательное)
+    # Поле для картинки (необязательное); одинаковые картинки хранятся
+    # одним файлом, индекс нужен для подсчёта ссылок на него
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=ContentAddressedStorage(),
+        db_index=True,
     )
+    # Размеры и превью картинки считаются один раз при её сохранении:
+    # страница резервирует место и показывает превью до загрузки
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты автора и группы: отбор и сортировка по одному индексу.
+        # SQLite дописывает в индекс rowid (id) по возрастанию, поэтому
+        # дата тоже по возрастанию: обратный обход даёт pub_date DESC,
+        # id DESC без сортировки, см. test_query_plans
+        indexes = [
+            models.Index(
+                fields=['author', 'pub_date'], name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.image_width = self.image_height = None
+            self.image_placeholder = ''
+        elif not self.image._committed:
+            # Новый файл ещё не записан в хранилище и читается из загрузки
+            self.image_width, self.image_height, self.image_placeholder = (
+                image_metadata(self.image.file))
+        # При редактировании не перезаписываем счётчики значениями,
+        # прочитанными до чужих лайков и комментариев
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class AuthorStats(models.Model):
+    """Денормализованные число постов и число подписчиков автора."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.author}: {self.posts_count}'
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -103,3 +168,67 @@ class Like(models.Model):
                 fields=['user', 'post'], name='unique_post_user_following'
             )
         ]
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост в ленте подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Автор и дата копируются из поста: по автору чистим ленту
+    # при отписке, по дате лента читается диапазоном индекса
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_user_post'
+            )
+        ]
+        indexes = [
+            # post - второй ключ сортировки ленты, чтобы и страница,
+            # и курсор читались из индекса без сортировки
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+
+
+class ChunkedUpload(models.Model):
+    """Картинка, которую клиент загружает частями до создания поста.
+
+    Части дописываются во временный файл; готовая загрузка
+    прикрепляется к PostForm по токену.
+    """
+    token = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                             editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='uploads'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.filename}: {self.offset}/{self.size}'
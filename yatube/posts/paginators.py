@@ -0,0 +1,164 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+DEFAULT_ORDERING = ('pub_date', 'id')
+
+
+class FeedPaginator(Paginator):
+    """Пагинатор ленты: COUNT(*) считается по одним pk.
+
+    Аннотации ленты подписок (feed_date, feed_id) иначе обернули бы
+    подсчёт в подзапрос.
+    """
+
+    @cached_property
+    def count(self):
+        return self.object_list.values('pk').count()
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и ключ записи в непрозрачный токен."""
+    data = json.dumps([direction, values])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для битого токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPage(Sequence):
+    """Страница ключевой пагинации: без номеров, только соседние токены."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Ключевая (keyset) пагинация по убыванию полей ordering.
+
+    Вместо COUNT(*) и OFFSET страница выбирается условием
+    «(pub_date, id) меньше ключа последней записи», поэтому глубокие
+    страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, object_list, per_page, ordering=DEFAULT_ORDERING):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = ordering
+
+    def _key(self, obj):
+        values = [getattr(obj, field) for field in self.ordering]
+        # isoformat() сохраняет микросекунды, иначе ключ «съедет»
+        return [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+
+    def _field(self, name):
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def _parse(self, values):
+        """Приводит значения ключа из токена к типам полей ordering.
+
+        Токен приходит от клиента: значение, которое поле не принимает,
+        не должно доходить до filter(). Для такого ключа возвращает None.
+        """
+        if len(values) != len(self.ordering):
+            return None
+        try:
+            parsed = [
+                self._field(name).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            return None
+        if any(value is None for value in parsed):
+            return None
+        return parsed
+
+    def _seek(self, values, lookup):
+        """Условие «ключ строго после values» для составного ключа."""
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            step = Q(**dict(zip(self.ordering[:position], values)))
+            step &= Q(**{f'{field}__{lookup}': values[position]})
+            condition |= step
+        return condition
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is not None:
+            values = self._parse(decoded[1])
+            decoded = (decoded[0], values) if values is not None else None
+        if decoded is None:
+            direction, queryset = NEXT, self.object_list
+        else:
+            direction, values = decoded
+            lookup = 'lt' if direction == NEXT else 'gt'
+            queryset = self.object_list.filter(self._seek(values, lookup))
+        if direction == NEXT:
+            order = [f'-{field}' for field in self.ordering]
+        else:
+            order = list(self.ordering)
+        rows = list(queryset.order_by(*order)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows, self, None, None)
+        has_next = has_more if direction == NEXT else True
+        has_previous = decoded is not None and (
+            direction == NEXT or has_more
+        )
+        next_cursor = (
+            encode_cursor(NEXT, self._key(rows[-1])) if has_next else None
+        )
+        previous_cursor = (
+            encode_cursor(PREVIOUS, self._key(rows[0]))
+            if has_previous else None
+        )
+        return CursorPage(rows, self, next_cursor, previous_cursor)
@@ -0,0 +1,150 @@
+import math
+import re
+
+from django.db import NotSupportedError, connection
+from django.db.models.expressions import RawSQL
+
+from yatube.settings import PAGE_COUNT
+
+from .models import Post
+from .paginators import NEXT, CursorPage, decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_post_fts'
+# Совпадение в заголовке весит больше, чем в тексте
+TITLE_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+MAX_TERMS = 16
+
+TERM_RE = re.compile(r'\w+')
+
+SEARCH_SQL = f'''
+    SELECT ranked.id, ranked.score
+    FROM (
+        SELECT rowid AS id,
+               bm25({FTS_TABLE}, {TITLE_WEIGHT}, {TEXT_WEIGHT}) AS score
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s
+    ) AS ranked
+    JOIN posts_post AS post ON post.id = ranked.id
+    WHERE {{filters}}
+    ORDER BY ranked.score, ranked.id
+    LIMIT %s
+'''
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Переводит запрос пользователя в выражение MATCH.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 из запроса не
+    разбирались; последнее ищется по префиксу - для поиска по мере ввода.
+    """
+    terms = TERM_RE.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def matching_posts(queryset, query):
+    """Отбор постов запросом без ранжирования - для админки."""
+    expression = match_expression(query)
+    if expression is None:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [expression],
+    ))
+
+
+def cursor_key(cursor):
+    """Пара (score, id) из токена курсора или None для чужого токена.
+
+    Токен приходит от клиента, и значения из него попадают в параметры
+    SQL: всё, что не приводится к числам, отбрасывается.
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if not decoded or decoded[0] != NEXT or len(decoded[1]) != 2:
+        return None
+    try:
+        score, last_id = float(decoded[1][0]), int(decoded[1][1])
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not math.isfinite(score):
+        return None
+    return score, last_id
+
+
+def search_posts(query, group_id=None, author_id=None, cursor=None,
+                 per_page=PAGE_COUNT):
+    """Страница найденных постов по убыванию релевантности BM25.
+
+    Курсор - пара (score, id) последнего поста; у каждого поста
+    страницы заполнен атрибут score.
+    """
+    if not search_enabled():
+        raise NotSupportedError('Полнотекстовый поиск требует SQLite FTS5')
+    expression = match_expression(query)
+    if expression is None:
+        return CursorPage([], None, None, None)
+    filters, params = ['1'], [expression]
+    if group_id is not None:
+        filters.append('post.group_id = %s')
+        params.append(group_id)
+    if author_id is not None:
+        filters.append('post.author_id = %s')
+        params.append(author_id)
+    key = cursor_key(cursor)
+    if key is not None:
+        score, last_id = key
+        filters.append(
+            '(ranked.score > %s OR (ranked.score = %s AND ranked.id > %s))'
+        )
+        params.extend([score, score, last_id])
+    params.append(per_page + 1)
+    with connection.cursor() as db:
+        db.execute(SEARCH_SQL.format(filters=' AND '.join(filters)), params)
+        rows = db.fetchall()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, score in rows]
+    )
+    found = []
+    for post_id, score in rows:
+        post = posts[post_id]
+        post.score = score
+        found.append(post)
+    next_cursor = (
+        encode_cursor(NEXT, [rows[-1][1], rows[-1][0]]) if has_next else None
+    )
+    return CursorPage(found, None, next_cursor, None)
+
+
+def unindex_post(post_id):
+    # Внешний индекс удаляет запись по её прежним значениям,
+    # поэтому вызывается до изменения строки в posts_post
+    with connection.cursor() as db:
+        db.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) "
+            f"SELECT 'delete', id, title, text FROM posts_post WHERE id = %s",
+            [post_id],
+        )
+
+
+def index_post(post_id):
+    with connection.cursor() as db:
+        db.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, title, text) '
+            f'SELECT id, title, text FROM posts_post WHERE id = %s',
+            [post_id],
+        )
+
+
+def rebuild_index():
+    """Перестраивает индекс по таблице постов и уплотняет его."""
+    with connection.cursor() as db:
+        db.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+        db.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
@@ -0,0 +1,182 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, media, search, timelines
+from .cache import (author_scope, bump_versions, group_scope,
+                    post_feed_scopes)
+from .likes import forget_liked_posts
+from .models import Comment, Follow, Group, Like, Post
+
+
+# Счётчик подписчиков меняется раньше лент: по нему они решают,
+# раздавать ли посты автора
+@receiver(post_save, sender=Follow)
+def follow_count_author(sender, instance, created, **kwargs):
+    if created:
+        counters.change_author_counter(
+            instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncount_author(sender, instance, **kwargs):
+    counters.change_author_counter(instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, **kwargs):
+    if created:
+        timelines.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_fill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timelines.follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_prune_timeline(sender, instance, **kwargs):
+    # Удаление поста и пользователя чистит ленты каскадом по FK
+    timelines.unfollow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def post_count_author(sender, instance, created, **kwargs):
+    if created:
+        counters.change_author_counter(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncount_author(sender, instance, **kwargs):
+    counters.change_author_counter(instance.author_id, 'posts_count', -1)
+
+
+def forget_liked_posts_on_commit(user_id):
+    # До фиксации соседний запрос успел бы снова закешировать набор
+    # лайков без этого изменения
+    transaction.on_commit(lambda: forget_liked_posts(user_id))
+
+
+@receiver(post_save, sender=Like)
+def like_count(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_counter(instance.post_id, 'likes_count', 1)
+        forget_liked_posts_on_commit(instance.user_id)
+
+
+@receiver(post_delete, sender=Like)
+def like_uncount(sender, instance, **kwargs):
+    counters.change_post_counter(instance.post_id, 'likes_count', -1)
+    forget_liked_posts_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_count(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_counter(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncount(sender, instance, **kwargs):
+    counters.change_post_counter(instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_init, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    # Группа на момент загрузки: при переносе поста сбрасываем обе
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_init, sender=Post)
+def post_remember_image(sender, instance, **kwargs):
+    # Из БД картинка приходит строкой; новый файл загрузки ещё не имя
+    image = instance.__dict__.get('image')
+    instance._loaded_image = image if isinstance(image, str) else ''
+
+
+@receiver(post_save, sender=Post)
+def post_release_replaced_image(sender, instance, created, **kwargs):
+    # Файл мог остаться у других постов: release_image проверит ссылки
+    name = instance.image.name or ''
+    if (not created and instance._loaded_image
+            and instance._loaded_image != name):
+        media.release_image_on_commit(instance._loaded_image)
+    instance._loaded_image = name
+
+
+@receiver(post_delete, sender=Post)
+def post_release_image(sender, instance, **kwargs):
+    # Срабатывает и при каскадном удалении вместе с автором
+    if instance.image:
+        media.release_image_on_commit(instance.image.name)
+
+
+def bump_versions_on_commit(scopes):
+    # Ленты сбрасываются сразу и ещё раз после фиксации: до неё соседний
+    # запрос успел бы собрать и закешировать страницу без этого
+    # изменения. Имена лент считаются сразу - при каскадном удалении
+    # автора или группы после фиксации их уже не найти
+    bump_versions(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(scopes))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_invalidate_feeds(sender, instance, **kwargs):
+    group_ids = {instance.group_id, instance._loaded_group_id} - {None}
+    bump_versions_on_commit(post_feed_scopes(instance.author_id, group_ids))
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def counter_invalidate_feeds(sender, instance, **kwargs):
+    # Счётчики выводятся в карточке поста во всех лентах с ним
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'author_id', 'group_id').first()
+    if post is not None:
+        author_id, group_id = post
+        bump_versions_on_commit(
+            post_feed_scopes(author_id, {group_id} - {None}))
+
+
+@receiver(post_save, sender=Group)
+def group_invalidate_feed(sender, instance, **kwargs):
+    bump_versions_on_commit([group_scope(instance.slug)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_invalidate_profile(sender, instance, **kwargs):
+    bump_versions_on_commit([author_scope(instance.author.username)])
+
+
+SEARCH_FIELDS = {'title', 'text'}
+
+
+def changes_search_fields(update_fields):
+    return update_fields is None or SEARCH_FIELDS & set(update_fields)
+
+
+@receiver(pre_save, sender=Post)
+def post_unindex_before_edit(sender, instance, update_fields, **kwargs):
+    if (search.search_enabled() and not instance._state.adding
+            and changes_search_fields(update_fields)):
+        search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def post_index(sender, instance, update_fields, **kwargs):
+    if search.search_enabled() and changes_search_fields(update_fields):
+        search.index_post(instance.pk)
+
+
+@receiver(pre_delete, sender=Post)
+def post_unindex(sender, instance, **kwargs):
+    if search.search_enabled():
+        search.unindex_post(instance.pk)
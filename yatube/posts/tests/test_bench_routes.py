@@ -0,0 +1,49 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from ..management.commands.bench_routes import ROUTES
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class BenchRoutesTest(TransactionTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        author = User.objects.create_user(username='author')
+        User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        Post.objects.create(title='Первый пост', text='Текст',
+                            author=author, group=group)
+
+    def test_all_routes_run_through_wsgi(self):
+        first = os.path.join(self.tmp_dir, 'first.json')
+        # Тестовая база в памяти с общим кешем не ждёт блокировок:
+        # сценарий с записью идёт в один поток
+        call_command('bench_routes', scenario='all', requests=60, warmup=0,
+                     threads=1, weights=['post_detail=20'], output=first,
+                     stdout=StringIO())
+        with open(first) as file:
+            results = json.load(file)
+        self.assertEqual(results['total']['requests'], 60)
+        self.assertEqual(results['total']['errors'], 0)
+        self.assertEqual(sum(results['total']['histogram']), 60)
+        self.assertLessEqual(set(results['routes']), set(ROUTES))
+        detail = results['routes']['post_detail']
+        self.assertGreater(detail['queries'], 0)
+        self.assertLessEqual(detail['p50'], detail['p99'])
+        out = StringIO()
+        call_command('bench_routes', requests=20, warmup=0, threads=2,
+                     weights=['index=1', 'post_detail=0'], compare=first,
+                     stdout=out)
+        self.assertIn('Сравнение с', out.getvalue())
+        self.assertNotIn('post_detail', out.getvalue())
@@ -0,0 +1,83 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..counters import get_followers_count, get_posts_count
+from ..models import AuthorStats, Comment, Follow, Like, Post
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.user = User.objects.create_user(username='AngelNad')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Тестовый текст поста', author=self.author
+        )
+        self.post_url = reverse('posts:post_detail', args=[self.post.pk])
+
+    def test_like_and_dislike_update_counter(self):
+        self.authorized_client.get(
+            reverse('posts:post_like', args=[self.post.pk]),
+            HTTP_REFERER=self.post_url,
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.authorized_client.get(
+            reverse('posts:post_dislike', args=[self.post.pk]),
+            HTTP_REFERER=self.post_url,
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_updates_counter(self):
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Комментарий'},
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        response = self.authorized_client.get(self.post_url)
+        self.assertEqual(response.context['count_post_comments'], 1)
+
+    def test_author_posts_count(self):
+        self.assertEqual(get_posts_count(self.author), 1)
+        post = Post.objects.create(text='Второй пост', author=self.author)
+        self.assertEqual(get_posts_count(self.author), 2)
+        post.delete()
+        self.assertEqual(get_posts_count(self.author), 1)
+
+    def test_author_followers_count(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(get_followers_count(self.author), 1)
+        follow.delete()
+        self.assertEqual(get_followers_count(self.author), 0)
+
+    def test_edit_does_not_overwrite_counters(self):
+        """Сохранение поста не затирает счётчики устаревшим значением."""
+        stale = Post.objects.get(pk=self.post.pk)
+        Like.objects.create(user=self.user, post=self.post)
+        stale.text = 'Новый текст'
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_recount_command_repairs_drift(self):
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.update(likes_count=5, comments_count=0)
+        AuthorStats.objects.all().delete()
+        out = StringIO()
+        call_command('recount_counters', batch_size=1, stdout=out)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(get_posts_count(self.author), 1)
+        self.assertEqual(get_followers_count(self.author), 1)
+        self.assertIn('исправлено 1', out.getvalue())
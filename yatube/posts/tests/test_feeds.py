@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from yatube.settings import PAGE_COUNT
+
+from ..likes import get_liked_post_ids
+from ..models import Comment, Follow, Group, Like, Post
+
+User = get_user_model()
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Описание тестовой группы'
+        )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='AngelNad')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+
+    def create_posts(self, count):
+        """Создаём посты с лайками и комментариями."""
+        for n in range(count):
+            post = Post.objects.create(
+                text=f'Тестовая запись {n}',
+                author=self.author,
+                group=self.group,
+            )
+            Like.objects.create(user=self.user, post=post)
+            Comment.objects.create(post=post, author=self.user, text='Ок')
+
+    def get_query_counts(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:follow_index'),
+        )
+        counts = {}
+        for url in urls:
+            cache.clear()
+            with self.assertNumQueries(self.expected_queries[url]):
+                response = self.authorized_client.get(url)
+            counts[url] = len(response.context['page_obj'])
+        return counts
+
+    @property
+    def expected_queries(self):
+        # сессия и пользователь + COUNT(*) и страница постов
+        # + набор лайков пользователя (кеш очищен)
+        base = 5
+        return {
+            reverse('posts:index'): base,
+            # + группа
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}):
+                base + 1,
+            # + автор, число его постов и проверка подписки
+            reverse('posts:profile', kwargs={'username': 'auth'}): base + 3,
+            # + авторы, посты которых подтягиваются при чтении
+            reverse('posts:follow_index'): base + 1,
+        }
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        """Число запросов ленты не зависит от количества постов."""
+        self.create_posts(1)
+        for url, count in self.get_query_counts().items():
+            with self.subTest(url=url):
+                self.assertEqual(count, 1)
+        self.create_posts(PAGE_COUNT)
+        for url, count in self.get_query_counts().items():
+            with self.subTest(url=url):
+                self.assertEqual(count, PAGE_COUNT)
+
+    def test_feed_annotations(self):
+        """Счётчики и отметка «нравится» приходят в карточку поста."""
+        self.create_posts(1)
+        response = self.authorized_client.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+        self.assertEqual(post.likes_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        dislike_url = reverse('posts:post_dislike', args=[post.pk])
+        self.assertContains(response, dislike_url)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, dislike_url)
+
+    def test_liked_set_is_cached_between_requests(self):
+        """Набор лайков читается из кеша и обновляется после лайка."""
+        self.create_posts(1)
+        post = Post.objects.create(text='Ещё пост', author=self.author)
+        liked = get_liked_post_ids(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_liked_post_ids(self.user), liked)
+        callbacks = []
+        with mock.patch('posts.signals.transaction.on_commit',
+                        callbacks.append):
+            Like.objects.create(user=self.user, post=post)
+        # До фиксации транзакции в кеше остаётся прежний набор
+        self.assertNotIn(post.pk, get_liked_post_ids(self.user))
+        for callback in callbacks:
+            callback()
+        self.assertIn(post.pk, get_liked_post_ids(self.user))
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -7,6 +8,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from core.storage import hashed_name
+
 from ..models import Comment, Group, Post
 
 User = get_user_model()
@@ -94,11 +97,13 @@ class PostFormTests(TestCase):
         self.assertEqual(response.context['page_obj'][0].author,
                          self.user)
         # Проверяем, что при отправке поста с картинкой
-        # создаётся запись в базе данных
+        # создаётся запись в базе данных; файл назван по хешу содержимого
+        image_name = hashed_name(f'posts/{uploaded.name}',
+                                 hashlib.sha256(small_gif).hexdigest())
         self.assertTrue(
             Post.objects.filter(
                 text=form_data['text'],
-                image=f'posts/{uploaded.name}',
+                image=image_name,
                 group=PostFormTests.group.id
             ).exists()
         )
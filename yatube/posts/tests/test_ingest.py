@@ -0,0 +1,138 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..ingest import PLACEHOLDER_SIDE, decode_bounded, open_header
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def encode(image, image_format):
+    file_obj = BytesIO()
+    image.save(file_obj, image_format)
+    return file_obj.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=1000,
+                   IMAGE_MAX_PIXELS=20 * 10 ** 6)
+class ImageIngestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.big_jpeg = encode(Image.new('RGB', (4000, 3000), 'red'), 'JPEG')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, name, content):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'title': 'Заголовок',
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def test_large_jpeg_decoded_at_reduced_scale(self):
+        """Пиковый растр в памяти меньше полного в draft-масштабе."""
+        image = open_header(BytesIO(self.big_jpeg))
+        full_bytes = 4000 * 3000 * 3
+        image, decoded_bytes = decode_bounded(image, 1000)
+        self.assertLessEqual(decoded_bytes, full_bytes // 9)
+        self.assertEqual(image.size, (1000, 750))
+
+    def test_large_upload_stored_downscaled(self):
+        self.create_post('photo.png', encode(
+            Image.new('RGB', (3000, 1500), 'blue'), 'PNG'))
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (1000, 500))
+            self.assertEqual(stored.format, 'JPEG')
+
+    def test_transparent_upload_stays_png(self):
+        self.create_post('logo.png', encode(
+            Image.new('RGBA', (2000, 2000), (0, 0, 0, 0)), 'PNG'))
+        with Image.open(Post.objects.get().image.path) as stored:
+            self.assertEqual(stored.format, 'PNG')
+            self.assertEqual(stored.size, (1000, 1000))
+
+    def test_small_gif_kept_as_is(self):
+        self.create_post('small.gif', SMALL_GIF)
+        with open(Post.objects.get().image.path, 'rb') as stored:
+            self.assertEqual(stored.read(), SMALL_GIF)
+
+    def test_decompression_bomb_rejected(self):
+        # 25 Мп однобитной картинки сжимаются в несколько килобайт
+        bomb = encode(Image.new('1', (5000, 5000)), 'PNG')
+        response = self.create_post('bomb.png', bomb)
+        self.assertFormError(response, 'form', 'image',
+                             'Слишком большое изображение: не больше 20 Мп.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_upload_stores_dimensions_and_placeholder(self):
+        self.create_post('photo.jpg', encode(
+            Image.new('RGB', (800, 400), 'green'), 'JPEG'))
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (800, 400))
+        prefix = 'data:image/jpeg;base64,'
+        self.assertTrue(post.image_placeholder.startswith(prefix))
+        preview = base64.b64decode(post.image_placeholder[len(prefix):])
+        with Image.open(BytesIO(preview)) as image:
+            self.assertEqual(image.size, (PLACEHOLDER_SIDE, 8))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="800" height="400"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_clearing_image_resets_metadata(self):
+        self.create_post('photo.jpg', encode(
+            Image.new('RGB', (80, 40), 'green'), 'JPEG'))
+        post = Post.objects.get()
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_command_fills_missing_metadata(self):
+        self.create_post('photo.jpg', encode(
+            Image.new('RGB', (80, 40), 'green'), 'JPEG'))
+        Post.objects.update(image_width=None, image_height=None,
+                            image_placeholder='')
+        # Пост со ссылкой на отсутствующий файл сохраняется без превью
+        missing = Post.objects.create(text='Без файла', author=self.user,
+                                      image='posts/missing.jpg')
+        call_command('generate_thumbnails', workers=1, stdout=StringIO(),
+                     stderr=StringIO())
+        post = Post.objects.exclude(pk=missing.pk).get()
+        self.assertEqual((post.image_width, post.image_height), (80, 40))
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+        missing.refresh_from_db()
+        self.assertIsNone(missing.image_width)
@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from core.storage import is_hashed_name
+
+from ..media import image_refcount
+from ..models import Post
+from ..thumbnails import generate_thumbnails
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_jpeg(color):
+    file_obj = BytesIO()
+    Image.new('RGB', (40, 30), color).save(file_obj, 'JPEG')
+    return file_obj.getvalue()
+
+
+def run_on_commit(callback):
+    callback()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedMediaTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_identical_uploads_share_one_file(self):
+        for name in ('first.jpg', 'second.JPEG'):
+            self.authorized_client.post(reverse('posts:post_create'), {
+                'title': 'Заголовок',
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(name, make_jpeg('red')),
+            })
+        first, second = Post.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_hashed_name(first.image.name))
+        self.assertEqual(image_refcount(first.image.name), 2)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory),
+                         [os.path.basename(first.image.path)])
+
+    def test_convert_command_merges_existing_files(self):
+        # Файлы в старой раскладке, как до хранилища по хешу
+        storage = FileSystemStorage()
+        content = make_jpeg('blue')
+        old_names = [
+            storage.save('posts/a.jpg', ContentFile(content)),
+            storage.save('posts/b.jpg', ContentFile(content)),
+            storage.save('posts/c.jpg', ContentFile(make_jpeg('green'))),
+        ]
+        for name in old_names:
+            Post.objects.create(text='Пост', author=self.user, image=name)
+        Post.objects.create(text='Пост', author=self.user,
+                            image='posts/missing.jpg')
+        out, err = StringIO(), StringIO()
+        call_command('convert_media_to_cas', batch_size=2,
+                     stdout=out, stderr=err)
+        self.assertIn('перенесено: 2', out.getvalue())
+        self.assertIn('дубликатов: 1', out.getvalue())
+        self.assertIn('posts/missing.jpg', err.getvalue())
+        names = list(Post.objects.exclude(image='posts/missing.jpg')
+                     .order_by('pk').values_list('image', flat=True))
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+        self.assertTrue(all(is_hashed_name(name) for name in names))
+        for name in old_names:
+            self.assertFalse(storage.exists(name))
+        out = StringIO()
+        call_command('convert_media_to_cas', stdout=out, stderr=StringIO())
+        self.assertIn('уже по хешу: 2', out.getvalue())
+
+
+@mock.patch('posts.media.transaction.on_commit', run_on_commit)
+class MediaGarbageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        override = override_settings(MEDIA_ROOT=self.media_root,
+                                     MEDIA_RELEASE_MIN_AGE=0,
+                                     THUMBNAIL_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, color):
+        return Post.objects.create(
+            text='Пост', author=self.user,
+            image=SimpleUploadedFile('photo.jpg', make_jpeg(color)),
+        )
+
+    def thumbnail_path(self, post):
+        thumbnail = get_thumbnail(post.image, '20x20')
+        return thumbnail.storage.path(thumbnail.name)
+
+    def test_replaced_image_removed_with_thumbnails(self):
+        post = self.create_post('red')
+        old_path = post.image.path
+        thumbnail_path = self.thumbnail_path(post)
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=[post.pk]), {
+                'title': 'Заголовок',
+                'text': 'Новая картинка',
+                'image': SimpleUploadedFile('new.jpg', make_jpeg('blue')),
+            })
+        post.refresh_from_db()
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(os.path.exists(thumbnail_path))
+
+    def test_shared_file_removed_with_last_post(self):
+        first = self.create_post('red')
+        self.create_post('red')
+        path = first.image.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        # Каскадное удаление вместе с автором
+        self.user.delete()
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(MEDIA_RELEASE_MIN_AGE=60)
+    def test_fresh_file_kept_for_concurrent_upload(self):
+        """Свежий файл переживает удаление поста, его соберёт gc_media."""
+        post = self.create_post('red')
+        path = post.image.path
+        post.delete()
+        self.assertTrue(os.path.exists(path))
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertFalse(os.path.exists(path))
+
+    def test_gc_removes_orphans(self):
+        live = self.create_post('red')
+        orphan = self.create_post('blue')
+        generate_thumbnails(orphan.image.name)
+        orphan_path = orphan.image.path
+        # Ссылка пропала без сигналов, как при правке базы вручную
+        Post.objects.filter(pk=orphan.pk).update(image='')
+        stray = os.path.join(self.media_root, 'cache', 'aa', 'stray.jpg')
+        os.makedirs(os.path.dirname(stray))
+        with open(stray, 'wb') as file:
+            file.write(make_jpeg('green'))
+        out = StringIO()
+        call_command('gc_media', min_age=0, dry_run=True, stdout=out)
+        self.assertIn(f'Картинка без постов: {orphan.image.name}',
+                      out.getvalue())
+        self.assertIn('Лишняя миниатюра: cache/aa/stray.jpg', out.getvalue())
+        self.assertTrue(os.path.exists(orphan_path))
+        out = StringIO()
+        call_command('gc_media', min_age=0, stdout=out)
+        self.assertIn('Удалено: картинок: 1', out.getvalue())
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertFalse(os.path.exists(stray))
+        self.assertTrue(os.path.exists(live.image.path))
+        out = StringIO()
+        call_command('gc_media', min_age=0, stdout=out)
+        self.assertIn('Мусора нет', out.getvalue())
+
+    def test_gc_keeps_recent_files(self):
+        orphan = self.create_post('blue')
+        Post.objects.filter(pk=orphan.pk).update(image='')
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan.image.path))
@@ -0,0 +1,117 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Like, Post
+
+User = get_user_model()
+
+# Полный проход по таблице (не по индексу) и сортировка во временном
+# B-дереве; SCAN ... USING INDEX - упорядоченный обход индекса с LIMIT.
+# SQLite до 3.36 пишет полный проход как SCAN TABLE ...
+FULL_SCAN_RE = re.compile(r'^SCAN (TABLE )?\w+$')
+BAD_PLAN_RE = re.compile(r'^SCAN (TABLE )?\w+$|USE TEMP B-TREE')
+CURSOR_PAGINATION = {
+    'index': 'cursor',
+    'group_posts': 'cursor',
+    'profile': 'cursor',
+    'follow_index': 'cursor',
+}
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент, поста и лайков идут по индексам без сортировки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.author,
+                                group=cls.group)
+            for number in range(15)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+        Like.objects.create(post=cls.posts[0], user=cls.reader)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def bad_plans(self, queries, bad_plan_re):
+        bad = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                if any(bad_plan_re.search(detail) for detail in details):
+                    bad.append(f'{sql}\n  ' + '\n  '.join(details))
+        return bad
+
+    def assert_indexed(self, method, url, bad_plan_re=BAD_PLAN_RE):
+        # Страницы собираются заново: кеш лент не прячет запросы
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            method(url)
+        self.assertEqual(
+            self.bad_plans(queries.captured_queries, bad_plan_re), [])
+
+    def check_pages(self, cursor=False):
+        get = self.reader_client.get
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_posts', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assert_indexed(get, url)
+        if not cursor:
+            return
+        # Следующая страница ключевой пагинации - по ссылке из первой
+        for name, args in (('index', []), ('group_posts', [self.group.slug]),
+                           ('profile', [self.author.username]),
+                           ('follow_index', [])):
+            response = get(reverse(f'posts:{name}', args=args))
+            cursor = response.context['page_obj'].next_cursor
+            if cursor is not None:
+                url = reverse(f'posts:{name}', args=args) + f'?cursor={cursor}'
+                with self.subTest(url=url):
+                    self.assert_indexed(get, url)
+
+    def test_feed_and_detail_queries(self):
+        self.check_pages()
+
+    @override_settings(PAGINATION_MODE=CURSOR_PAGINATION)
+    def test_cursor_feed_queries(self):
+        self.check_pages(cursor=True)
+
+    def test_like_queries(self):
+        for name in ('post_like', 'post_dislike'):
+            url = reverse(f'posts:{name}', args=[self.post.pk])
+            with self.subTest(url=url):
+                self.assert_indexed(self.reader_client.get, url)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_feed_with_pulled_authors(self):
+        # Посты из ленты и от pull-авторов ищутся по индексам, но их
+        # объединение через OR сортируется отдельно
+        self.assert_indexed(self.reader_client.get,
+                            reverse('posts:follow_index'), FULL_SCAN_RE)
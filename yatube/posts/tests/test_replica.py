@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, TransactionTestCase
+from django.urls import reverse
+
+from core.routers import PIN_COOKIE, REPLICA_ALIAS, replica_reads
+
+from ..models import Post
+
+User = get_user_model()
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Копия тестовой базы в файле изображает реплику
+        self.tmp_dir = tempfile.mkdtemp()
+        connections.databases[REPLICA_ALIAS] = {
+            **connection.settings_dict,
+            'NAME': os.path.join(self.tmp_dir, 'replica.sqlite3'),
+            'OPTIONS': {'pragmas': {'query_only': 1}},
+        }
+        self.addCleanup(self.drop_replica)
+        self.author = User.objects.create_user(username='author')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.refresh()
+
+    def drop_replica(self):
+        connections[REPLICA_ALIAS].close()
+        del connections.databases[REPLICA_ALIAS]
+        if hasattr(connections._connections, REPLICA_ALIAS):
+            delattr(connections._connections, REPLICA_ALIAS)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def refresh(self):
+        call_command('refresh_replica', stdout=StringIO())
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        with replica_reads():
+            self.assertFalse(Post.objects.exists())
+            post = Post.objects.create(text='Пост', author=self.author)
+            self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.refresh()
+        with replica_reads():
+            replicated = Post.objects.get(pk=post.pk)
+        self.assertEqual(replicated._state.db, REPLICA_ALIAS)
+        # Объект из реплики сохраняется в основную базу
+        replicated.text = 'Правка'
+        replicated.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Правка')
+
+    def test_writer_is_pinned_to_primary(self):
+        response = self.author_client.post(
+            reverse('posts:post_create'), {'title': 'Заголовок',
+                                           'text': 'Новый пост'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        post = Post.objects.get()
+        url = reverse('posts:post_detail', args=[post.pk])
+        # Автор видит свой пост сразу, остальные - после обновления
+        self.assertEqual(self.author_client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.refresh()
+        response = self.client.get(url)
+        self.assertContains(response, 'Новый пост')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_pinned_writer_skips_cached_feeds(self):
+        """Страница из отстающей реплики не отдаётся автору из кеша."""
+        self.author_client.post(reverse('posts:post_create'),
+                                {'title': 'Заголовок', 'text': 'Новый пост'})
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Гость собирает и кеширует страницу из реплики
+                self.assertNotContains(self.client.get(url), 'Новый пост')
+                self.assertContains(self.author_client.get(url),
+                                    'Новый пост')
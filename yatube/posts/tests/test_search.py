@@ -0,0 +1,110 @@
+from io import StringIO
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from ..models import Group, Post
+from ..paginators import NEXT, encode_cursor
+from ..search import search_posts
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Описание тестовой группы'
+        )
+        cls.in_title = Post.objects.create(
+            title='Кошки', text='Про домашних животных', author=cls.author
+        )
+        cls.in_text = Post.objects.create(
+            title='Заметка', text='Сегодня видел кошки во дворе',
+            author=cls.other, group=cls.group,
+        )
+        Post.objects.create(title='Собаки', text='Про собак',
+                            author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def found(self, query, **kwargs):
+        return [post.pk for post in search_posts(query, **kwargs)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.found('кошки'),
+                         [self.in_title.pk, self.in_text.pk])
+        self.assertEqual(self.found('кош'),
+                         [self.in_title.pk, self.in_text.pk])
+
+    def test_filters(self):
+        self.assertEqual(self.found('кошки', group_id=self.group.pk),
+                         [self.in_text.pk])
+        self.assertEqual(self.found('кошки', author_id=self.author.pk),
+                         [self.in_title.pk])
+
+    def test_fts_syntax_in_query_is_literal(self):
+        self.assertEqual(self.found('кошки OR NOT "собаки'), [])
+        self.assertEqual(self.found('  ,,  '), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(title='Черновик', text='Старый текст',
+                                   author=self.author)
+        post.text = 'Новый текст про попугаев'
+        post.save()
+        self.assertEqual(self.found('попугаев'), [post.pk])
+        self.assertEqual(self.found('старый'), [])
+        post.delete()
+        self.assertEqual(self.found('попугаев'), [])
+
+    def test_cursor_pagination(self):
+        page = search_posts('кошки', per_page=1)
+        self.assertEqual([post.pk for post in page], [self.in_title.pk])
+        page = search_posts('кошки', cursor=page.next_cursor, per_page=1)
+        self.assertEqual([post.pk for post in page], [self.in_text.pk])
+        self.assertFalse(page.has_next())
+
+    def test_invalid_cursor_returns_first_page(self):
+        for values in ([[1], 1], ['x', 'y'], [1.5, {'a': 1}], [None, 1]):
+            with self.subTest(values=values):
+                response = self.guest_client.get(
+                    reverse('posts:search_json'),
+                    {'q': 'кошки', 'cursor': encode_cursor(NEXT, values)},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), 2)
+
+    def test_search_views(self):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'кошки', 'group': 'test-slug'}
+        )
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.in_text])
+        response = self.guest_client.get(
+            reverse('posts:search_json'), {'q': 'кошки', 'author': 'auth'}
+        )
+        results = response.json()['results']
+        self.assertEqual([item['id'] for item in results],
+                         [self.in_title.pk])
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_rebuild_command_and_admin_search(self):
+        # Массовое изменение в обход модели индекс не видит
+        Post.objects.filter(pk=self.in_title.pk).update(title='Попугаи')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('попугаи'), [self.in_title.pk])
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, distinct = site._registry[Post].get_search_results(
+            request, Post.objects.all(), 'кошки'
+        )
+        self.assertEqual(list(queryset), [self.in_text])
+        self.assertFalse(distinct)
@@ -0,0 +1,58 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from ..models import Comment, Follow, Like, Post, TimelineEntry, User
+
+SMALL = {'users': 30, 'groups': 3, 'posts': 200, 'follows': 150,
+         'likes': 300, 'comments': 100, 'batch_size': 64}
+
+
+class SeedCommandTest(TestCase):
+    def seed(self, **options):
+        out = StringIO()
+        call_command('seed', stdout=out, **{**SMALL, **options})
+        return out.getvalue()
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by('pk').values_list(
+                'author__username', 'group__slug', 'pub_date', 'text')),
+            sorted(Follow.objects.values_list(
+                'user__username', 'author__username')),
+            Like.objects.count(),
+        )
+
+    def seeded_snapshot(self, **options):
+        # Каждый прогон откатывается, следующий начинает с пустой базы
+        with transaction.atomic():
+            self.seed(**options)
+            snapshot = self.snapshot()
+            transaction.set_rollback(True)
+        return snapshot
+
+    def test_seed_is_reproducible(self):
+        first = self.seeded_snapshot()
+        self.assertEqual(self.seeded_snapshot(), first)
+        self.assertNotEqual(self.seeded_snapshot(seed=1), first)
+
+    def test_seed_fills_derived_data(self):
+        out = self.seed()
+        self.assertIn('строк/с', out)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        # Пары повторяются - уникальный индекс оставляет по одной
+        self.assertLessEqual(Like.objects.count(), 300)
+        self.assertTrue(TimelineEntry.objects.exists())
+        post = Post.objects.order_by('-likes_count').first()
+        self.assertEqual(post.likes_count, post.liking_post.count())
+        self.assertEqual(post.author.stats.posts_count,
+                         post.author.posts.count())
+        # Степенной закон: самый популярный автор заметно впереди
+        authors = sorted(
+            (author.posts.count() for author in User.objects.all()),
+            reverse=True)
+        self.assertGreater(authors[0], 3 * authors[len(authors) // 2])
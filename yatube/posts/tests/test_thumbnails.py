@@ -0,0 +1,193 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+
+from ..models import Post
+from .. import thumbnails
+from ..thumbnails import (get_ready_variants, prefetch_post_thumbnails,
+                          submit, supported_formats)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='photo.jpg', size=(1920, 678)):
+    file_obj = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(file_obj, 'JPEG')
+    return SimpleUploadedFile(name, file_obj.getvalue(),
+                              content_type='image/jpeg')
+
+
+def run_on_commit(callback):
+    callback()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(thumbnails._failed.clear)
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_created_post_gets_thumbnail_outside_template(self):
+        with mock.patch('posts.thumbnails.transaction.on_commit',
+                        run_on_commit):
+            self.authorized_client.post(reverse('posts:post_create'), {
+                'title': 'Заголовок',
+                'text': 'Пост с картинкой',
+                'image': make_image(),
+            })
+        post = Post.objects.get()
+        ready = get_ready_variants(post.image, 'card')
+        self.assertEqual(len(ready), 3 * len(supported_formats()))
+        self.assertEqual(
+            [thumbnail.width for variant, thumbnail in ready[-3:]],
+            [320, 640, 960],
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/jpeg"')
+        self.assertContains(response, f'{ready[-3][1].url} 320w')
+        self.assertContains(response, f'src="{ready[-1][1].url}"')
+        if 'WEBP' in supported_formats():
+            self.assertContains(response, 'type="image/webp"')
+
+    def test_pending_thumbnail_falls_back_to_original(self):
+        # Внутри транзакции теста on_commit не срабатывает:
+        # миниатюра остаётся в очереди
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   image=make_image())
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertIsNone(get_ready_variants(post.image, 'card'))
+
+    def test_command_generates_missing_thumbnails(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   image=make_image())
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Картинок обработано: 1, ошибок: 0', out.getvalue())
+        self.assertIsNotNone(get_ready_variants(post.image, 'card'))
+
+    def test_command_resumes_from_checkpoint(self):
+        # Разные размеры - разные файлы в хранилище по хешу
+        posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=self.user,
+                image=make_image(size=(100 + number, 50)),
+            )
+            for number in range(3)
+        ]
+        names = sorted(post.image.name for post in posts)
+        checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'thumbnails.checkpoint')
+        with open(checkpoint, 'w') as file:
+            file.write(names[0])
+        out, err = StringIO(), StringIO()
+        with mock.patch('posts.management.commands.generate_thumbnails'
+                        '.generate_thumbnails',
+                        side_effect=[None, OSError('битый файл')]) as mocked:
+            call_command('generate_thumbnails', workers=1, batch_size=1,
+                         checkpoint=checkpoint, stdout=out, stderr=err)
+        self.assertEqual([call.args[0] for call in mocked.call_args_list],
+                         names[1:])
+        self.assertIn('Картинок обработано: 1, ошибок: 1', out.getvalue())
+        self.assertIn('картинок/с', out.getvalue())
+        self.assertIn(f'{names[2]}: OSError: битый файл', err.getvalue())
+        # Завершённый проход удаляет контрольную точку
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_bytes_benchmark(self):
+        Post.objects.create(text='Пост', author=self.user,
+                            image=make_image())
+        out = StringIO()
+        call_command('bench_image_bytes', viewports='360,1280', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('Картинок на странице: 1', lines[0])
+        self.assertIn('Экран 360px x1: ', lines[1])
+        self.assertIn('JPEG', lines[1])
+        self.assertIn('(+0%)', lines[2])
+
+    def test_bytes_benchmark_skips_missing_image(self):
+        missing = Post.objects.create(text='Пост', author=self.user,
+                                      image=make_image())
+        Post.objects.filter(pk=missing.pk).update(image='posts/missing.jpg')
+        Post.objects.create(text='Пост', author=self.user,
+                            image=make_image())
+        out = StringIO()
+        with mock.patch.object(thumbnails, 'schedule_thumbnails') as schedule:
+            with self.assertLogs('sorl.thumbnail', 'ERROR'):
+                call_command('bench_image_bytes', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f'Пропущен пост {missing.pk}', output)
+        self.assertIn('Картинок на странице: 1', output)
+        schedule.assert_not_called()
+
+    def test_feed_page_reads_thumbnails_in_one_batch(self):
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.user,
+                                image=make_image(f'photo{number}.jpg'))
+            for number in range(3)
+        ]
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        cache.clear()
+        # Холодный кеш: одно чтение таблицы sorl на всю страницу
+        with self.assertNumQueries(1):
+            prefetched = prefetch_post_thumbnails(posts)
+        self.assertTrue(all(prefetched.values()))
+        with self.assertNumQueries(0):
+            prefetch_post_thumbnails(posts)
+        # Теги ленты берут миниатюры из общей выборки, а не по одной
+        cache.clear()
+        with mock.patch.object(KVStore, '_get_raw',
+                               side_effect=AssertionError):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>', count=3)
+
+    def test_ready_thumbnails_refresh_cached_feed(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   image=make_image())
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, '<picture>')
+        submit(post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+
+    def test_failed_source_is_not_rescheduled(self):
+        """Картинка без файла не сбрасывает кеш ленты при каждом показе."""
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   image=make_image())
+        Post.objects.filter(pk=post.pk).update(image='posts/missing.jpg')
+        cache.clear()
+        url = reverse('posts:index')
+        with mock.patch('posts.thumbnails.transaction.on_commit',
+                        run_on_commit), \
+                mock.patch('posts.thumbnails.generate_thumbnails',
+                           wraps=thumbnails.generate_thumbnails) as generate, \
+                self.assertLogs('posts.thumbnails', 'WARNING'), \
+                self.assertLogs('sorl.thumbnail', 'ERROR'):
+            self.client.get(url)
+            response = self.client.get(url)
+            self.client.get(url)
+        self.assertNotIn('page_obj', response.context)
+        self.assertEqual(generate.call_count, 1)
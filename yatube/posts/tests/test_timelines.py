@@ -0,0 +1,118 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import AuthorStats, Follow, Post, TimelineEntry
+from ..timelines import pull_authors
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.user = User.objects.create_user(username='AngelNad')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.old_post = Post.objects.create(
+            text='Пост до подписки', author=self.author
+        )
+
+    def timeline(self):
+        return set(
+            TimelineEntry.objects.filter(user=self.user).values_list(
+                'post', flat=True)
+        )
+
+    def test_follow_fills_timeline(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.timeline(), {self.old_post.pk})
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.timeline(), {self.old_post.pk, post.pk})
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_unfollow_and_delete_prune_timeline(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        post.delete()
+        self.assertEqual(self.timeline(), {self.old_post.pk})
+        follow.delete()
+        self.assertEqual(self.timeline(), set())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_pull_author_posts_are_read_at_request_time(self):
+        """Посты популярного автора не пишутся в ленты, но видны в них."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.timeline(), set())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_pull_authors_read_followers_counter(self):
+        """Pull-авторы определяются по счётчику, без COUNT по подпискам."""
+        Follow.objects.create(user=self.user, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(pull_authors(self.user), [self.author.pk])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        AuthorStats.objects.update(followers_count=0)
+        self.assertEqual(pull_authors(self.user), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_back_under_limit_fills_timelines(self):
+        """Когда pull-автор теряет подписчиков, его посты раздаются."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.user, author=self.author)
+        follow = Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.timeline(), {self.old_post.pk})
+        follow.delete()
+        self.assertEqual(self.timeline(), {self.old_post.pk, post.pk})
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_rebuild_all_uses_followers_counter(self):
+        """Массовая пересборка выбирает pull-авторов по счётчику."""
+        Follow.objects.create(user=self.user, author=self.author)
+        AuthorStats.objects.update(followers_count=2)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline(), set())
+        AuthorStats.objects.update(followers_count=1)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline(), {self.old_post.pk})
+
+    def test_rebuild_command_repairs_timeline(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.timeline(), {self.old_post.pk})
+
+    @override_settings(TIMELINE_BACKFILL=1)
+    def test_rebuild_all_matches_per_user_rebuild(self):
+        other = User.objects.create_user(username='other')
+        newest = Post.objects.create(text='Новый пост', author=self.author)
+        Post.objects.create(text='Пост другого', author=other)
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.author, author=other)
+        expected = set(TimelineEntry.objects.values_list(
+            'user', 'post', 'author', 'pub_date'))
+        self.assertIn((self.user.pk, newest.pk, self.author.pk,
+                       newest.pub_date), expected)
+        self.assertEqual(len(expected), 2)
+        TimelineEntry.objects.create(user=self.user, post=self.old_post,
+                                     author=self.author,
+                                     pub_date=self.old_post.pub_date)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'user', 'post', 'author', 'pub_date')), expected)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import ChunkedUpload, Post
+from ..uploads import upload_path
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CHUNK_SIZE = 1000
+
+
+def make_jpeg():
+    file_obj = BytesIO()
+    Image.effect_noise((80, 60), 64).convert('RGB').save(file_obj, 'JPEG')
+    return file_obj.getvalue()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   UPLOAD_TEMP_DIR=os.path.join(TEMP_MEDIA_ROOT, 'uploads'),
+                   UPLOAD_CHUNK_SIZE=CHUNK_SIZE)
+class ChunkedUploadTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.content = make_jpeg()
+        self.assertGreater(len(self.content), CHUNK_SIZE)
+
+    def start(self, sha=None, filename='photo.jpg'):
+        response = self.authorized_client.post(reverse('posts:upload_start'), {
+            'filename': filename,
+            'size': len(self.content),
+            'sha256': sha or sha256(self.content),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, token, offset, data, checksum=None):
+        return self.authorized_client.post(
+            reverse('posts:upload_chunk', args=[token]), data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=checksum or sha256(data),
+        )
+
+    def upload_all(self, token, offset=0):
+        while offset < len(self.content):
+            chunk = self.content[offset:offset + CHUNK_SIZE]
+            response = self.send(token, offset, chunk)
+            if response.status_code != 200:
+                break
+            offset = response.json()['offset']
+        return response
+
+    def test_upload_resumes_and_attaches_to_post(self):
+        token = self.start()['token']
+        first = self.content[:CHUNK_SIZE]
+        self.assertEqual(self.send(token, 0, first).json()['offset'],
+                         CHUNK_SIZE)
+        # Повтор уже принятой части после обрыва связи
+        response = self.send(token, 0, first)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], CHUNK_SIZE)
+        response = self.send(token, CHUNK_SIZE, b'x', checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        status = self.authorized_client.get(
+            reverse('posts:upload_chunk', args=[token])).json()
+        self.assertEqual(status['offset'], CHUNK_SIZE)
+        self.assertTrue(self.upload_all(token, CHUNK_SIZE).json()['completed'])
+        upload = ChunkedUpload.objects.get()
+        path = upload_path(upload)
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'title': 'Заголовок',
+            'text': 'Пост с картинкой частями',
+            'upload_token': token,
+        })
+        post = Post.objects.get()
+        with post.image.open('rb') as image:
+            self.assertEqual(image.read(), self.content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_invalid_form_closes_upload_file(self):
+        token = self.start()['token']
+        self.upload_all(token)
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'title': 'Заголовок', 'text': '', 'upload_token': token},
+        )
+        form = response.context['form']
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.upload_file.closed)
+        self.assertTrue(ChunkedUpload.objects.exists())
+
+    def test_non_image_upload_rejected(self):
+        cases = (
+            ('photo.jpg', b'just some text, not a jpeg'),
+            ('photo.txt', self.content),
+        )
+        for filename, content in cases:
+            with self.subTest(filename=filename):
+                self.content = content
+                token = self.start(filename=filename)['token']
+                self.upload_all(token)
+                response = self.authorized_client.post(
+                    reverse('posts:post_create'),
+                    {'title': 'Заголовок', 'text': 'Пост',
+                     'upload_token': token},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['form'].errors['image'])
+                self.assertFalse(Post.objects.exists())
+
+    def test_corrupted_file_starts_over(self):
+        token = self.start(sha='0' * 64)['token']
+        response = self.upload_all(token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(os.path.getsize(
+            upload_path(ChunkedUpload.objects.get())), 0)
+
+    def test_foreign_or_unfinished_upload_rejected(self):
+        token = self.start()['token']
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+        response = other.post(
+            reverse('posts:upload_chunk', args=[token]), b'data',
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0', HTTP_UPLOAD_CHECKSUM=sha256(b'data'),
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'title': 'Заголовок', 'text': 'Пост', 'upload_token': token},
+        )
+        self.assertFormError(
+            response, 'form', 'upload_token',
+            'Загрузка картинки не найдена или не завершена.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_oversized_upload_rejected(self):
+        response = self.authorized_client.post(
+            reverse('posts:upload_start'),
+            {'filename': 'big.jpg', 'size': settings.UPLOAD_MAX_SIZE + 1,
+             'sha256': '0' * 64},
+        )
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(UPLOAD_EXPIRES=0)
+    def test_gc_removes_abandoned_uploads(self):
+        self.start()
+        path = upload_path(ChunkedUpload.objects.get())
+        out = StringIO()
+        call_command('gc_media', stdout=out)
+        self.assertIn('загрузок: 1', out.getvalue())
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.path.exists(path))
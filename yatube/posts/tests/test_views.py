@@ -1,13 +1,17 @@
+from unittest import mock
+
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from yatube.settings import PAGE_COUNT
 
-from ..models import Follow, Group, Post
+from ..cache import FEED_LOCK_KEY, feed_page_key
+from ..models import Follow, Group, Like, Post
+from ..paginators import NEXT, encode_cursor
 
 User = get_user_model()
 
@@ -199,15 +203,78 @@ class PostPagesTests(TestCase):
         self.assertEqual(response.context['page_obj'][0].author,
                          post_new.author)
         page_cached = response.content
-        post_new.delete()
+        # Пока лента не менялась, страница отдаётся из кеша
         response = self.author_client.get(reverse('posts:index'))
+        self.assertNotIn('page_obj', response.context)
         self.assertEqual(page_cached, response.content)
-        cache.clear()
+        # Удаление поста сразу сбрасывает кеш ленты
+        post_new.delete()
         response = self.author_client.get(reverse('posts:index'))
         self.assertNotEqual(page_cached, response.content)
         response_count_last = len(response.context['page_obj'])
         self.assertEqual(posts_count, response_count_last)
 
+    def test_cache_invalidated_again_after_commit(self):
+        """Страницу, собранную до фиксации, сбрасывает on_commit."""
+        url = reverse('posts:index')
+        callbacks = []
+        with mock.patch('posts.signals.transaction.on_commit',
+                        callbacks.append):
+            Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(callbacks)
+        self.guest_client.get(url)
+        response = self.guest_client.get(url)
+        self.assertNotIn('page_obj', response.context)
+        for callback in callbacks:
+            callback()
+        response = self.guest_client.get(url)
+        self.assertIn('page_obj', response.context)
+
+    def test_cache_invalidated_by_group_and_author_changes(self):
+        """Лайк и новый пост сбрасывают страницы группы и профиля."""
+        urls = (
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                response = self.guest_client.get(url)
+                self.assertNotIn('page_obj', response.context)
+                Like.objects.create(user=self.user2, post=PostPagesTests.post)
+                response = self.guest_client.get(url)
+                self.assertEqual(
+                    response.context['page_obj'][0].likes_count, 1)
+                Like.objects.all().delete()
+        self.guest_client.get(urls[0])
+        Post.objects.create(text='Новый пост', author=self.author,
+                            group=self.group)
+        response = self.guest_client.get(urls[0])
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_cached_page_is_shared_with_personal_fragments(self):
+        """Общая страница из кеша получает шапку и лайки посетителя."""
+        Like.objects.create(user=self.user, post=PostPagesTests.post)
+        url = reverse('posts:index')
+        dislike_url = reverse('posts:post_dislike', args=[61])
+        response = self.guest_client.get(url)
+        self.assertContains(response, reverse('users:login'))
+        self.assertNotContains(response, dislike_url)
+        response = self.authorized_client.get(url)
+        self.assertNotIn('page_obj', response.context)
+        self.assertContains(response, 'Пользователь: AngelNad')
+        self.assertContains(response, dislike_url)
+        response = self.authorized_client2.get(url)
+        self.assertContains(response, 'Пользователь: Neo')
+        self.assertNotContains(response, dislike_url)
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        Follow.objects.create(user=self.user, author=self.author)
+        self.guest_client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Отписаться')
+        response = self.authorized_client2.get(url)
+        self.assertContains(response, 'Подписаться')
+
     def test_authorized_user_follow(self):
         # проверяем, что авторизованный пользователь
         # может подписываться на других пользователей
@@ -320,3 +387,156 @@ class ErrorTestClass(TestCase):
         self.assertEqual(response.status_code, 404)
         # Проверяется, что используется шаблон core/404.html
         self.assertTemplateUsed(response, 'core/404.html')
+
+    def test_cached_feed_404_has_header(self):
+        """404 кешируемой ленты собирается с шапкой, без меток."""
+        for url in ('/group/unknown/', '/profile/unknown/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotContains(response, '<!--fragment:',
+                                       status_code=404)
+                self.assertContains(response, reverse('users:login'),
+                                    status_code=404)
+
+
+@override_settings(PAGINATION_MODE={'index': 'cursor',
+                                    'group_posts': 'cursor'})
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.count_new_post = 2 * PAGE_COUNT + 3
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Описание тестовой группы'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Тестовая запись {n}', author=cls.user,
+                 group=cls.group)
+            for n in range(cls.count_new_post)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсоры ведут по всей ленте вперёд и назад без повторов."""
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list(
+                'pk', flat=True)
+        )
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_posts',
+                            kwargs={'slug': 'test-slug'})):
+            with self.subTest(url=url):
+                seen, pages = [], []
+                page_obj = self.client.get(url).context['page_obj']
+                self.assertFalse(page_obj.has_previous())
+                while True:
+                    pages.append(page_obj)
+                    seen.extend(post.pk for post in page_obj)
+                    if not page_obj.has_next():
+                        break
+                    page_obj = self.client.get(
+                        url, {'cursor': page_obj.next_cursor}
+                    ).context['page_obj']
+                self.assertEqual(seen, expected)
+                self.assertEqual(len(pages[-1]),
+                                 self.count_new_post - 2 * PAGE_COUNT)
+                response = self.client.get(
+                    url, {'cursor': pages[-1].previous_cursor})
+                self.assertEqual(list(response.context['page_obj']),
+                                 list(pages[-2]))
+
+    def test_cursor_page_has_no_count_query(self):
+        """Ключевая пагинация не делает COUNT(*)."""
+        with self.assertNumQueries(1):
+            self.client.get(reverse('posts:index'))
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': 'broken'})
+        self.assertEqual(len(response.context['page_obj']), PAGE_COUNT)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_with_invalid_values_returns_first_page(self):
+        """Ключ, который не приводится к типам полей, не даёт 500."""
+        for values in (['x', 'y'], [None, None], [[1], {'a': 1}],
+                       ['2022-01-01T00:00:00+00:00', 'id']):
+            with self.subTest(values=values):
+                response = self.client.get(
+                    reverse('posts:index'),
+                    {'cursor': encode_cursor(NEXT, values)})
+                self.assertEqual(response.status_code, 200)
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), PAGE_COUNT)
+                self.assertFalse(page_obj.has_previous())
+
+
+@override_settings(PAGINATOR_WINDOW=2)
+class PaginatorWindowTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(text=f'Тестовая запись {n}', author=cls.user)
+            for n in range(PAGE_COUNT * 10)
+        )
+
+    def test_page_links_are_bounded(self):
+        """Выводятся ссылки только на соседние страницы."""
+        cache.clear()
+        response = self.client.get(reverse('posts:index'), {'page': 5})
+        for number in range(3, 8):
+            self.assertContains(response, f'href="?page={number}"'
+                                if number != 5 else '>5</span>')
+        self.assertNotContains(response, 'href="?page=2"')
+        self.assertNotContains(response, 'href="?page=8"')
+        self.assertContains(response, 'href="?page=10"')
+
+
+class FeedStampedeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(text='Старый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+        request = self.client.get(self.url).wsgi_request
+        self.lock_key = FEED_LOCK_KEY.format(key=feed_page_key(request))
+
+    def test_stale_page_served_while_rebuilding(self):
+        """Пока другой запрос пересобирает ленту, отдаётся прежняя."""
+        Post.objects.create(text='Новый пост', author=self.user)
+        cache.add(self.lock_key, 'другой запрос')
+        response = self.client.get(self.url)
+        self.assertNotIn('page_obj', response.context)
+        self.assertNotContains(response, 'Новый пост')
+        cache.delete(self.lock_key)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Новый пост')
+        self.assertIsNone(cache.get(self.lock_key))
+
+    @override_settings(FEED_LOCK_WAIT=0)
+    def test_rendered_without_lock_when_nothing_to_serve(self):
+        cache.clear()
+        cache.add(self.lock_key, 'другой запрос')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Старый пост')
+        self.assertIn('page_obj', response.context)
+
+    def test_early_refresh(self):
+        """Близкая к сроку запись вероятностно пересобирается заранее."""
+        with override_settings(FEED_EARLY_REFRESH_BETA=0):
+            response = self.client.get(self.url)
+            self.assertNotIn('page_obj', response.context)
+        with override_settings(FEED_EARLY_REFRESH_BETA=10 ** 12):
+            response = self.client.get(self.url)
+            self.assertIn('page_obj', response.context)
@@ -0,0 +1,287 @@
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDbKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .cache import bump_post_feeds
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class PresetBackend(ThumbnailBackend):
+    """Бэкенд sorl, умеющий найти готовую миниатюру, не создавая её."""
+
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        # Имя миниатюры строится так же, как в ThumbnailBackend.get_thumbnail
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        thumbnail = self.get_thumbnail_file(
+            file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+
+backend = PresetBackend()
+
+
+# MIME-типы форматов для <source type="...">
+MIME_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+}
+
+Variant = namedtuple('Variant', 'width format geometry options')
+
+
+def supported_formats():
+    """THUMBNAIL_FORMATS без тех, что не умеет кодировать Pillow."""
+    return [
+        image_format for image_format in settings.THUMBNAIL_FORMATS
+        if image_format != 'WEBP' or features.check('webp')
+    ]
+
+
+def get_preset(name):
+    """Ширина и высота рамки пресета и его атрибут sizes."""
+    preset = settings.THUMBNAIL_PRESETS[name]
+    width, height = map(int, preset['geometry'].split('x'))
+    return width, height, preset.get('sizes', f'{width}px')
+
+
+def get_variants(name):
+    """Варианты миниатюры пресета: каждая ширина в каждом формате."""
+    options = dict(settings.THUMBNAIL_PRESETS[name])
+    width, height = map(int, options.pop('geometry').split('x'))
+    widths = options.pop('widths', [width])
+    options.pop('sizes', None)
+    return [
+        Variant(
+            variant_width,
+            image_format,
+            f'{variant_width}x{round(height * variant_width / width)}',
+            {**options, 'format': image_format},
+        )
+        for image_format in supported_formats()
+        for variant_width in widths
+    ]
+
+
+def read_kvstore(keys):
+    """Значения ключей хранилища sorl одним чтением кеша и одним - БД.
+
+    KVStore.get читает по ключу за раз; здесь то же для пачки ключей,
+    включая запоминание отсутствующих в кеше, как это делает sorl.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDbKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        loaded = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(loaded)
+    return {
+        key: None if value == EMPTY_VALUE else value
+        for key, value in values.items()
+    }
+
+
+def prefetch_thumbnails(images, preset, schedule=True):
+    """Готовые варианты миниатюр для всех картинок страницы сразу.
+
+    Возвращает {имя картинки: пары (вариант, миниатюра) или None}.
+    Неготовые миниатюры ставит в очередь, чтобы картинки, загруженные
+    до появления очереди, дозаполнялись сами, если schedule. Картинки,
+    для которых создать миниатюры уже не удалось, повторно не ставятся:
+    их дозаполняет команда generate_thumbnails.
+    """
+    names = {image.name for image in images if image}
+    variants = get_variants(preset)
+    keys = {
+        name: [
+            add_prefix(backend.get_thumbnail_file(
+                name, variant.geometry, **variant.options).key)
+            for variant in variants
+        ]
+        for name in names
+    }
+    values = read_kvstore(
+        [key for name_keys in keys.values() for key in name_keys])
+    prefetched = {}
+    for name, name_keys in keys.items():
+        if all(values.get(key) for key in name_keys):
+            prefetched[name] = [
+                (variant, deserialize_image_file(values[key]))
+                for variant, key in zip(variants, name_keys)
+            ]
+        else:
+            prefetched[name] = None
+            if schedule and name not in _failed:
+                schedule_thumbnails(name)
+    return prefetched
+
+
+def prefetch_post_thumbnails(posts, preset='card'):
+    return prefetch_thumbnails([post.image for post in posts], preset)
+
+
+def get_ready_variants(image, preset, schedule=True):
+    """Пары (вариант, миниатюра) для одной картинки или None."""
+    if not image:
+        return None
+    return prefetch_thumbnails([image], preset, schedule)[image.name]
+
+
+def picture_sources(ready):
+    """srcset для каждого формата и самая крупная миниатюра для <img>.
+
+    Последний формат THUMBNAIL_FORMATS - запасной для браузеров,
+    не понимающих предыдущие.
+    """
+    sources = {}
+    for variant, thumbnail in ready:
+        sources.setdefault(variant.format, []).append(thumbnail)
+    fallback_format = ready[-1][0].format
+    fallback = max(sources[fallback_format], key=lambda item: item.width)
+    return [
+        {
+            'type': MIME_TYPES[image_format],
+            'srcset': ', '.join(
+                f'{thumbnail.url} {thumbnail.width}w'
+                for thumbnail in thumbnails
+            ),
+        }
+        for image_format, thumbnails in sources.items()
+    ], fallback
+
+
+def all_variants():
+    return [
+        variant
+        for preset in settings.THUMBNAIL_PRESETS
+        for variant in get_variants(preset)
+    ]
+
+
+def generate_thumbnails(name):
+    """Создаёт все варианты миниатюр картинки для всех пресетов."""
+    for variant in all_variants():
+        backend.get_thumbnail(name, variant.geometry, **variant.options)
+
+
+def thumbnails_ready(name):
+    """Есть ли в хранилище sorl все варианты миниатюр картинки.
+
+    sorl не бросает исключений, если исходный файл не читается: он
+    пишет ошибку в лог и отдаёт заглушку, не сохраняя миниатюру.
+    """
+    keys = [
+        add_prefix(backend.get_thumbnail_file(
+            name, variant.geometry, **variant.options).key)
+        for variant in all_variants()
+    ]
+    values = read_kvstore(keys)
+    return all(values.get(key) for key in keys)
+
+
+_executor = None
+_pending = set()
+# Картинки, для которых миниатюры создать не удалось. Каждый показ
+# ленты ставил бы их в очередь снова и сбрасывал бы её кеш
+_failed = set()
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def refresh_feeds(name):
+    """Сбрасывает кешированные ленты с постами этой картинки.
+
+    Пока миниатюр не было, в кеш попала разметка с самой картинкой.
+    """
+    posts = Post.objects.filter(image=name).values_list(
+        'author_id', 'group_id')
+    for author_id, group_id in posts:
+        bump_post_feeds(author_id, {group_id} - {None})
+
+
+def run_generation(name, in_worker):
+    try:
+        generate_thumbnails(name)
+        if thumbnails_ready(name):
+            refresh_feeds(name)
+        else:
+            logger.warning('Не все миниатюры созданы для %s', name)
+            with _lock:
+                _failed.add(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        with _lock:
+            _failed.add(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        if in_worker:
+            # У потока пула свои соединения с БД, закрываем их сами
+            connections.close_all()
+
+
+def submit(name):
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if settings.THUMBNAIL_WORKERS:
+        get_executor().submit(run_generation, name, True)
+    else:
+        run_generation(name, False)
+
+
+def schedule_thumbnails(name):
+    """Создаёт миниатюры в фоне после фиксации транзакции.
+
+    Пул потоков снимает декодирование и масштабирование с запроса;
+    при THUMBNAIL_WORKERS = 0 миниатюры создаются сразу в вызывающем
+    потоке. Вне транзакции on_commit выполняется немедленно.
+    """
+    transaction.on_commit(lambda: submit(name))
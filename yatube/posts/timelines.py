@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .counters import get_followers_count
+from .models import Follow, Post, TimelineEntry
+
+# Ключ сортировки ленты подписок, см. timeline_posts
+TIMELINE_ORDERING = ('feed_date', 'feed_id')
+
+# Все ленты разом: каждому подписчику - посты его авторов, кроме
+# pull-авторов, не больше TIMELINE_BACKFILL последних от автора.
+# Pull-авторы выбираются по тому же счётчику AuthorStats, что и в
+# is_pull_author: иначе ленты расходились бы с пересборкой по одной
+REBUILD_ALL_SQL = '''
+    INSERT INTO posts_timelineentry (user_id, post_id, author_id, pub_date)
+    SELECT follow.user_id, post.id, post.author_id, post.pub_date
+    FROM posts_follow AS follow
+    JOIN (
+        SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC
+        ) AS position
+        FROM posts_post
+    ) AS post ON post.author_id = follow.author_id
+    LEFT JOIN posts_authorstats AS stats
+        ON stats.author_id = follow.author_id
+    WHERE COALESCE(stats.followers_count, 0) <= %s
+        AND (%s IS NULL OR post.position <= %s)
+'''
+
+
+def pull_authors(user):
+    """Авторы из подписок user, чьи посты не раздаются по лентам.
+
+    У таких авторов больше TIMELINE_FANOUT_LIMIT подписчиков: запись
+    в ленту каждого обошлась бы дороже, чем подтянуть посты при чтении.
+    Число подписчиков берётся из AuthorStats, а не считается по Follow.
+    """
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT),
+        ).values_list('author', flat=True)
+    )
+
+
+def is_pull_author(author):
+    return get_followers_count(author) > settings.TIMELINE_FANOUT_LIMIT
+
+
+def _entries(user_ids, posts):
+    for user_id in user_ids:
+        for post_id, author_id, pub_date in posts:
+            yield TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post):
+    """Раздаёт новый пост в ленты подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = (
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+        .iterator()
+    )
+    _bulk_insert(
+        _entries(followers, [(post.pk, post.author_id, post.pub_date)])
+    )
+
+
+def author_posts(author_id):
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('pk', 'author_id', 'pub_date')
+    )
+    if settings.TIMELINE_BACKFILL is not None:
+        posts = posts[:settings.TIMELINE_BACKFILL]
+    return posts
+
+
+def follow_author(user_id, author_id):
+    """Добавляет посты автора в ленту нового подписчика."""
+    if is_pull_author(author_id):
+        return
+    _bulk_insert(_entries([user_id], author_posts(author_id).iterator()))
+
+
+def backfill_followers(author_id):
+    """Добавляет посты автора в ленты всех его подписчиков."""
+    posts = list(author_posts(author_id))
+    followers = (
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+        .iterator()
+    )
+    _bulk_insert(_entries(followers, posts))
+
+
+def unfollow_author(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    if get_followers_count(author_id) == settings.TIMELINE_FANOUT_LIMIT:
+        # Автор снова раздаёт посты по лентам. Посты, вышедшие, пока
+        # их подтягивали при чтении, в лентах подписчиков отсутствуют
+        backfill_followers(author_id)
+
+
+def rebuild_timeline(user_id):
+    """Пересобирает ленту пользователя с нуля по его подпискам."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True
+    )
+    for author_id in authors:
+        follow_author(user_id, author_id)
+
+
+def rebuild_all_timelines():
+    """Пересобирает все ленты двумя запросами; возвращает число записей.
+
+    То же, что rebuild_timeline для каждого подписчика, но без запросов
+    на каждую подписку - для массовых загрузок в обход сигналов.
+    """
+    backfill = settings.TIMELINE_BACKFILL
+    with transaction.atomic(), connection.cursor() as db:
+        db.execute('DELETE FROM posts_timelineentry')
+        db.execute(REBUILD_ALL_SQL,
+                   [settings.TIMELINE_FANOUT_LIMIT, backfill, backfill])
+        return db.rowcount
+
+
+def timeline_posts(user):
+    """Посты ленты подписок: материализованная часть и pull-авторы.
+
+    Лента упорядочена по полям TIMELINE_ORDERING, они же - ключ
+    курсора. Материализованная лента сортируется по копии даты в
+    записи ленты и читается из индекса timeline_user_date_idx.
+    """
+    pulled = pull_authors(user)
+    if not pulled:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_id=F('timeline_entries__post'),
+        )
+    else:
+        posts = Post.objects.filter(
+            Q(pk__in=TimelineEntry.objects.filter(user=user).values('post'))
+            | Q(author__in=pulled)
+        ).annotate(feed_date=F('pub_date'), feed_id=F('pk'))
+    return posts.order_by(*(f'-{field}' for field in TIMELINE_ORDERING))
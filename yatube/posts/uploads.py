@@ -0,0 +1,116 @@
+"""Загрузка картинок частями с продолжением после обрыва.
+
+Клиент объявляет имя, размер и SHA-256 файла, затем отправляет части
+по порядку, каждую со своим смещением и хешем. Часть дописывается во
+временный файл, только если её смещение совпадает с уже принятым
+объёмом, поэтому повтор после обрыва начинается с места остановки.
+Собранный файл сверяется с объявленным хешем, и готовая загрузка
+прикрепляется к PostForm по токену.
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def upload_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{upload.token.hex}.part')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def start_upload(user, filename, size, sha256):
+    """Заводит загрузку и пустой временный файл для неё."""
+    sha256 = (sha256 or '').lower()
+    if not filename or not SHA256_RE.match(sha256):
+        raise ValidationError('Нужны имя файла и его SHA-256.',
+                              code='invalid')
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise ValidationError(
+            'Размер файла должен быть от 1 байта до %(limit)s.',
+            code='too_large', params={'limit': settings.UPLOAD_MAX_SIZE},
+        )
+    upload = ChunkedUpload.objects.create(
+        user=user, filename=os.path.basename(filename)[:255],
+        size=size, sha256=sha256,
+    )
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(upload_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(user, token, offset, data, sha256):
+    """Дописывает часть загрузки пользователя и возвращает загрузку.
+
+    Часть не с того смещения отклоняется с кодом 'offset': клиент
+    узнаёт принятый объём и продолжает с него.
+    """
+    if len(data) > settings.UPLOAD_CHUNK_SIZE:
+        raise ValidationError('Часть больше %(limit)s байт.',
+                              code='too_large',
+                              params={'limit': settings.UPLOAD_CHUNK_SIZE})
+    if hashlib.sha256(data).hexdigest() != (sha256 or '').lower():
+        raise ValidationError('Хеш части не совпал.', code='checksum')
+    with transaction.atomic():
+        # Одновременные части одной загрузки пишутся по очереди
+        upload = ChunkedUpload.objects.select_for_update().get(
+            pk=token, user=user)
+        if upload.completed or offset != upload.offset:
+            raise ValidationError('Неверное смещение части.', code='offset')
+        if offset + len(data) > upload.size:
+            raise ValidationError('Часть выходит за размер файла.',
+                                  code='invalid')
+        path = upload_path(upload)
+        with open(path, 'r+b') as file:
+            # Хвост от части, смещение которой не успели сохранить
+            file.truncate(offset)
+            file.seek(offset)
+            file.write(data)
+        upload.offset += len(data)
+        corrupted = False
+        if upload.offset == upload.size:
+            corrupted = file_sha256(path) != upload.sha256
+            upload.completed = not corrupted
+        if corrupted:
+            # Целиком файл не совпал: загружать его нужно заново
+            upload.offset = 0
+            open(path, 'wb').close()
+        upload.save(update_fields=['offset', 'completed'])
+    if corrupted:
+        raise ValidationError('Хеш файла не совпал.', code='checksum')
+    return upload
+
+
+def open_upload(upload):
+    """Готовая загрузка как файл формы."""
+    return UploadedFile(open(upload_path(upload), 'rb'),
+                        name=upload.filename, size=upload.size)
+
+
+def discard_upload(upload):
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def expired_uploads():
+    created = timezone.now() - timedelta(seconds=settings.UPLOAD_EXPIRES)
+    return ChunkedUpload.objects.filter(created__lt=created)
@@ -23,6 +23,12 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    # Загрузка картинки частями
+    path('uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:token>/', views.upload_chunk, name='upload_chunk'),
+    # Поиск по постам
+    path('search/', views.search, name='search'),
+    path('search/json/', views.search_json, name='search_json'),
     # Список постов по подписке
     path('follow/', views.follow_index, name='follow_index'),
     # Подписка на пост
@@ -1,76 +1,95 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
-from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.views.decorators.http import require_http_methods, require_POST
 
+from core.routers import read_from_replica
 from yatube.settings import PAGE_COUNT
 
+from .cache import GLOBAL_SCOPE, author_scope, cache_feed, group_scope
+from .counters import get_posts_count
+from .feeds import annotate_feed
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Like, Post, User
+from .likes import get_liked_post_ids
+from .models import ChunkedUpload, Follow, Group, Like, Post, User
+from .paginators import DEFAULT_ORDERING, CursorPaginator, FeedPaginator
+from .search import search_posts
+from .thumbnails import prefetch_post_thumbnails, schedule_thumbnails
+from .timelines import TIMELINE_ORDERING, timeline_posts
+from .uploads import append_chunk, start_upload
 
 
-def get_page_obj(objects, page_number, items_on_list):
-    return Paginator(objects, items_on_list).get_page(page_number)
+def get_page_obj(objects, request, view_name, items_on_list=PAGE_COUNT,
+                 ordering=DEFAULT_ORDERING):
+    # Режим пагинации задаётся для каждой ленты в PAGINATION_MODE
+    if settings.PAGINATION_MODE.get(view_name) == 'cursor':
+        paginator = CursorPaginator(objects, items_on_list, ordering)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = FeedPaginator(objects, items_on_list)
+    return paginator.get_page(request.GET.get('page'))
 
 
-@cache_page(20)
+@read_from_replica
+@cache_feed(lambda: [GLOBAL_SCOPE])
 def index(request):
-    post_list = Post.objects.all()
-    page_number = request.GET.get('page')
-    page_obj = get_page_obj(post_list, page_number, PAGE_COUNT)
+    post_list = annotate_feed(Post.objects.all())
+    page_obj = get_page_obj(post_list, request, 'index')
     context = {
         'page_obj': page_obj,
+        'post_thumbnails': prefetch_post_thumbnails(page_obj.object_list),
     }
     return render(request, 'posts/index.html', context)
 
 
+@read_from_replica
+@cache_feed(lambda slug: [group_scope(slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_number = request.GET.get('page')
-    page_obj = get_page_obj(post_list, page_number, PAGE_COUNT)
+    post_list = annotate_feed(group.posts.all())
+    page_obj = get_page_obj(post_list, request, 'group_posts')
     context = {
         'group': group,
         'page_obj': page_obj,
+        'post_thumbnails': prefetch_post_thumbnails(page_obj.object_list),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@read_from_replica
+@cache_feed(lambda username: [author_scope(username)])
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
     author = get_object_or_404(User, username=username)
     posts = author.posts.all()
-    post_count = posts.count()
-    page_number = request.GET.get('page')
-    page_obj = get_page_obj(posts, page_number, PAGE_COUNT)
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(user=request.user,
-                                  author=author).exists()
-    )
+    post_count = get_posts_count(author)
+    page_obj = get_page_obj(annotate_feed(posts), request, 'profile')
+    # Кнопка подписки - персональный фрагмент, см. posts.fragments
     context = {
         'posts': posts,
         'post_count': post_count,
         'author': author,
         'page_obj': page_obj,
-        'following': following,
+        'post_thumbnails': prefetch_post_thumbnails(page_obj.object_list),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@read_from_replica
 def post_detail(request, post_id):
     # Здесь код запроса к модели и создание словаря контекста
-    post_user = get_object_or_404(Post, pk=post_id)
-    post_count = post_user.author.posts.count()
-    form = CommentForm(request.POST or None)
-    post_comments = post_user.comments.all()
-    liking_post_user = (
-        request.user.is_authenticated
-        and Like.objects.filter(user=request.user, post=post_user).exists()
+    post_user = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
     )
-    count_like_post = Like.objects.filter(post=post_user).count()
-    count_post_comments = len(post_comments)
+    post_count = get_posts_count(post_user.author)
+    form = CommentForm(request.POST or None)
+    post_comments = post_user.comments.select_related('author')
+    liking_post_user = post_user.pk in get_liked_post_ids(request.user)
+    count_like_post = post_user.likes_count
+    count_post_comments = post_user.comments_count
     context = {
         'post_user': post_user,
         'post_count': post_count,
@@ -86,12 +105,18 @@ def post_detail(request, post_id):
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
-                    files=request.FILES or None
+                    files=request.FILES or None,
+                    user=request.user,
                     )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        # Пост и счётчик постов автора пишутся в одной транзакции
+        with transaction.atomic():
+            post.save()
+            if post.image:
+                schedule_thumbnails(post.image.name)
+        form.discard_upload()
         return redirect('posts:profile', username=post.author)
     return render(request, 'posts/create_post.html', {"form": form})
 
@@ -103,10 +128,18 @@ def post_edit(request, post_id):
         return redirect('posts:profile', username=post.author)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
-                    instance=post
+                    instance=post,
+                    user=request.user,
                     )
     if form.is_valid():
-        form.save()
+        # Пост и его запись в поисковом индексе меняются вместе
+        with transaction.atomic():
+            form.save()
+            image_changed = ('image' in form.changed_data
+                             or form.upload is not None)
+            if post.image and image_changed:
+                schedule_thumbnails(post.image.name)
+        form.discard_upload()
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -116,6 +149,72 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+# Коды ответа для ошибок загрузки частями; остальные - 400
+UPLOAD_ERROR_STATUS = {'offset': 409, 'too_large': 413}
+
+
+def upload_state(upload):
+    return {
+        'token': str(upload.token),
+        'offset': upload.offset,
+        'size': upload.size,
+        'completed': upload.completed,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }
+
+
+def upload_error(error, upload=None):
+    data = {'error': error.messages[0]}
+    if upload is not None:
+        # Клиент продолжает с принятого смещения
+        data.update(upload_state(upload))
+    return JsonResponse(data, status=UPLOAD_ERROR_STATUS.get(error.code, 400),
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    try:
+        upload = start_upload(request.user, request.POST.get('filename'),
+                              size, request.POST.get('sha256'))
+    except ValidationError as error:
+        return upload_error(error)
+    return JsonResponse(upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def upload_chunk(request, token):
+    """GET - сколько принято; POST - следующая часть в теле запроса.
+
+    Смещение части передаётся в заголовке Upload-Offset, её SHA-256 -
+    в Upload-Checksum.
+    """
+    if request.method == 'GET':
+        upload = get_object_or_404(ChunkedUpload, pk=token,
+                                   user=request.user)
+        return JsonResponse(upload_state(upload))
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+    except ValueError:
+        return upload_error(ValidationError('Нужен заголовок Upload-Offset.'))
+    try:
+        upload = append_chunk(request.user, token, offset, request.body,
+                              request.META.get('HTTP_UPLOAD_CHECKSUM'))
+    except ChunkedUpload.DoesNotExist:
+        raise Http404
+    except ValidationError as error:
+        upload = ChunkedUpload.objects.filter(
+            pk=token, user=request.user).first()
+        return upload_error(error, upload)
+    return JsonResponse(upload_state(upload))
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -124,17 +223,76 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def search_page(request):
+    # Фильтры по группе и автору необязательны
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    page_obj = search_posts(
+        query,
+        group_id=group.pk if group else None,
+        author_id=author.pk if author else None,
+        cursor=request.GET.get('cursor'),
+    )
+    return query, group, author, page_obj
+
+
+def search(request):
+    query, group, author, page_obj = search_page(request)
+    next_query = None
+    if page_obj.has_next():
+        params = request.GET.copy()
+        params['cursor'] = page_obj.next_cursor
+        next_query = params.urlencode()
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_obj': page_obj,
+        'post_thumbnails': prefetch_post_thumbnails(page_obj.object_list),
+        'next_query': next_query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def search_json(request):
+    query, group, author, page_obj = search_page(request)
+    results = [
+        {
+            'id': post.pk,
+            'title': post.title,
+            'text': post.text,
+            'author': post.author.username,
+            'group': post.group.slug if post.group else None,
+            'pub_date': post.pub_date,
+            'score': post.score,
+            'url': reverse('posts:post_detail', args=[post.pk]),
+        }
+        for post in page_obj
+    ]
+    return JsonResponse({
+        'results': results,
+        'next_cursor': page_obj.next_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@read_from_replica
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_number = request.GET.get('page')
-    page_obj = get_page_obj(post_list, page_number, PAGE_COUNT)
+    post_list = annotate_feed(timeline_posts(request.user))
+    page_obj = get_page_obj(post_list, request, 'follow_index',
+                            ordering=TIMELINE_ORDERING)
     context = {
         'page_obj': page_obj,
+        'post_thumbnails': prefetch_post_thumbnails(page_obj.object_list),
     }
     return render(request, 'posts/follow.html', context)
 
@@ -162,13 +320,15 @@ def post_like(request, post_id):
     author = post.author
     if author == request.user:
         return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
-    Like.objects.get_or_create(user=request.user, post=post)
+    with transaction.atomic():
+        Like.objects.get_or_create(user=request.user, post=post)
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
 @login_required
 def post_dislike(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    Like.objects.filter(user=request.user, post=post).delete()
+    with transaction.atomic():
+        Like.objects.filter(user=request.user, post=post).delete()
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.routers.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -87,13 +88,37 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.db - sqlite3 с WAL и настроенными PRAGMA (core/db/base.py);
+# соединение живёт в воркере CONN_MAX_AGE секунд, а не один запрос
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {'busy_timeout': 5000},
+        },
     }
 }
 
+# реплика для чтения лент (core/routers.py): копия основной базы,
+# которую обновляет команда refresh_replica; без YATUBE_REPLICA_PATH
+# все запросы идут в default
+if os.environ.get('YATUBE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'core.db',
+        'NAME': os.environ['YATUBE_REPLICA_PATH'],
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {'query_only': 1},
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# сколько секунд после записи клиент читает из основной базы;
+# не меньше интервала обновления реплики
+REPLICA_PIN_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,6 +174,26 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 # количество постов на одну страницу
 PAGE_COUNT = 10
 
+# режим пагинации лент: 'offset' - номера страниц (?page=),
+# 'cursor' - ключевая пагинация по (pub_date, id) (?cursor=)
+PAGINATION_MODE = {
+    'index': 'offset',
+    'group_posts': 'offset',
+    'profile': 'offset',
+    'follow_index': 'offset',
+}
+
+# сколько номеров страниц показывать по обе стороны от текущей
+PAGINATOR_WINDOW = 3
+
+# ленты подписок: посты автора с большим числом подписчиков
+# не раздаются по лентам при записи, а подтягиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# сколько последних постов автора добавлять в ленту при подписке
+# (None - все посты)
+TIMELINE_BACKFILL = None
+TIMELINE_BATCH_SIZE = 500
+
 # кастомизация ошибки 403: ошибка проверки CSRF, запрос отклонён
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
@@ -156,10 +201,71 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-# подключения бэкенда кеширования locmem.LocMemCache
+# MEDIA_URL отдаёт само приложение: ETag, 304, Range; если задан
+# MEDIA_ACCEL_REDIRECT (префикс internal-локации nginx, например
+# '/protected-media/'), файл передаёт прокси по X-Accel-Redirect
+MEDIA_SERVE = True
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+# файл картинки моложе стольких секунд не удаляется вместе с последней
+# ссылкой на него: такую же картинку могли только что загрузить в другом
+# запросе. Его позже соберёт gc_media
+MEDIA_RELEASE_MIN_AGE = 60
+
+# картинки крупнее IMAGE_MAX_SIDE по длинной стороне уменьшаются при
+# загрузке, картинки больше IMAGE_MAX_PIXELS отклоняются до декодирования
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_JPEG_QUALITY = 85
+
+# картинки можно загружать частями: части дописываются во временный
+# файл в UPLOAD_TEMP_DIR, незавершённые загрузки старше UPLOAD_EXPIRES
+# секунд удаляет gc_media
+UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_EXPIRES = 60 * 60 * 24
+
+# миниатюры картинок постов: по пресету на каждое место в шаблонах
+# widths - ширины вариантов для srcset, sizes - атрибут <source sizes>
+THUMBNAIL_PRESETS = {
+    'card': {
+        'geometry': '960x339',
+        'upscale': True,
+        'widths': (320, 640, 960),
+        'sizes': '(max-width: 960px) 100vw, 960px',
+    },
+}
+# форматы вариантов по убыванию предпочтения; последний - запасной для <img>
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+# потоки, создающие миниатюры вне запроса; 0 - создавать сразу
+THUMBNAIL_WORKERS = 2
+
+# двухуровневый кеш core.cache.TwoTierCache: L1 - LRU в памяти каждого
+# воркера, L2 - общий для воркеров файл SQLite YATUBE_CACHE_PATH;
+# изменения, сделанные одним воркером, другие увидят не позже SYNC_INTERVAL
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 1.0,
+        },
     }
 }
+# тесты работают со своим временным файлом кеша, см. core.test_runner
+TEST_RUNNER = 'core.test_runner.TempCacheRunner'
+
+# страницы лент сбрасываются сигналами при изменении содержимого;
+# таймаут лишь ограничивает жизнь записей с забытыми версиями
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# сколько ещё хранить устаревшую страницу, чтобы отдавать её на время
+# пересборки; пересобирает только запрос, взявший блокировку
+FEED_STALE_TIMEOUT = 60 * 60
+FEED_LOCK_TIMEOUT = 30
+# сколько ждать чужой сборки, если отдать нечего, прежде чем собрать самим
+FEED_LOCK_WAIT = 2
+# раннее вероятностное обновление перед истечением срока; 0 - выключено
+FEED_EARLY_REFRESH_BETA = 1.0